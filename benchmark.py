@@ -0,0 +1,203 @@
+"""
+Scaling benchmarks for the GA operators and for end-to-end runs.
+
+Sweeps instance size (n students, m groups), pop_size and elitism, timing every
+selection method, every crossover in crossover_methods.py (per pair and batched),
+mutate, repair_balance, initialize_population, swap_local_search, full
+genetic_algorithm runs and, for small instances, batches of them solved together.
+Each entry reports seconds per call, throughput and peak traced memory.
+
+Baselines are stored per machine tag; a run compared against its machine's
+baseline flags every entry that got slower by more than the threshold.
+
+    python benchmark.py                 # full sweep, compared with this machine's baseline
+    python benchmark.py --quick --save  # small sweep, stored as the new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+from problem import random_problem, set_problem
+from helpers import initialize_population, repair_balance, repair_balance_batch
+from genetic_algorithm import genetic_algorithm, random_population
+from local_search import swap_local_search
+from multi_instance import solve_instances
+from genetic_operations import *
+from crossover_methods import *
+from runner import available_cores
+
+SIZES = [(20, 4), (200, 10), (2000, 40)]
+POP_SIZES = [50, 300]
+ELITISMS = [1, 40]
+QUICK_SIZES = [(20, 4), (200, 10)]
+QUICK_POP_SIZES = [50]
+QUICK_ELITISMS = [1]
+SMALL_INSTANCE = 200  # Largest n benchmarked as a batch of instances
+
+selection_methods = {
+    "tournament_selection": tournament_selection,
+    "roulette_wheel_selection": roulette_wheel_selection,
+    "stochastic_universal_sampling": stochastic_universal_sampling,
+}
+
+crossover_functions = {
+    "single_point_crossover": single_point_crossover,
+    "uniform_crossover": uniform_crossover,
+    "bernouilli_crossover": bernouilli_crossover,
+    "two_point_crossover": two_point_crossover,
+    "heuristic_crossover": heuristic_crossover,
+    "heuristic_crossover2": heuristic_crossover2,
+    "stochastic_heuristic_crossover": stochastic_heuristic_crossover,
+}
+
+def machine_tag():
+    """Identifies the machine and software stack a baseline was measured on."""
+    return f"{platform.node()}-{platform.machine()}-{available_cores()}cpu-py{platform.python_version()}-numpy{np.__version__}"
+
+def measure(function, items=1, min_time=0.2, repeat=3):
+    """
+    Best-of-`repeat` seconds per call of `function`, its throughput in `items` per
+    second, and the peak memory traced during one extra call.
+    """
+    function()  # Warm up caches and lazily built tables
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        if time.perf_counter() - start >= min_time / repeat or calls >= 1 << 20:
+            break
+        calls *= 2
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        seconds = min(seconds, (time.perf_counter() - start) / calls)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "throughput": items / seconds, "peak_bytes": peak}
+
+def benchmark_operators(n, m, pop_size, seed=0):
+    """Entries for every operator on a random n x m instance and a population of pop_size."""
+    set_problem(random_problem(n, m, seed))
+    rng = np.random.default_rng(seed)
+    population = random_population(pop_size, rng)
+    genes = np.array([chrom.genes for chrom in population])
+    fitness_scores = population_fitness(genes)
+    indices = np.arange(pop_size)
+    parents1, parents2 = genes[0::2], genes[1::2]
+    pairs = len(parents2)
+    unbalanced = rng.integers(m, size=(pop_size, n)).astype(genes.dtype)
+    entries = {}
+
+    def add(name, unit, result):
+        entries[f"n={n} m={m} pop={pop_size} | {name}"] = dict(result, unit=unit)
+
+    for name, select in selection_methods.items():
+        add(name, "picks/s", measure(lambda: select(indices, fitness_scores, rng=rng)))
+        add(f"{name} (batch)", "picks/s", measure(lambda: batch_selection_methods[select](fitness_scores, pop_size, rng=rng), pop_size))
+    for name, crossover in crossover_functions.items():
+        add(name, "children/s", measure(lambda: crossover(parents1[0], parents2[0], rng=rng), 2))
+        if crossover in batch_crossover_methods:
+            add(f"{name} (batch)", "children/s", measure(lambda: batch_crossover_methods[crossover](parents1, parents2, rng=rng), 2 * pairs))
+    add("mutate", "children/s", measure(lambda: mutate(population[0].copy(), 1.0, rng)))
+    add("mutate_batch", "children/s", measure(lambda: mutate_batch(genes.copy(), 1.0, rng=rng), pop_size))
+    add("repair_balance", "children/s", measure(lambda: repair_balance(unbalanced[0].copy())))
+    add("repair_balance_batch", "children/s", measure(lambda: repair_balance_batch(unbalanced.copy()), pop_size))
+    add("initialize_population", "children/s", measure(lambda: initialize_population(pop_size, rng), pop_size))
+    add("swap_local_search (10 rounds)", "children/s", measure(lambda: swap_local_search(genes.copy(), max_rounds=10), pop_size))
+    return entries
+
+def benchmark_runs(n, m, pop_size, elitism, generations=20, seed=0):
+    """Entries for full genetic_algorithm runs with every crossover, without early stopping."""
+    set_problem(random_problem(n, m, seed))
+    entries = {}
+    for name, crossover in crossover_functions.items():
+        run = lambda: genetic_algorithm(pop_size, generations, elitism=elitism, patience=generations + 1, crossover_method=crossover, rng=seed)
+        entries[f"n={n} m={m} pop={pop_size} elitism={elitism} | genetic_algorithm {name}"] = dict(
+            measure(run, generations, min_time=0, repeat=1), unit="generations/s")
+    return entries
+
+def benchmark_instances(n, m, pop_size, instances=100, generations=20, seed=0):
+    """Entry for solve_instances on a batch of random n x m instances, without early stopping."""
+    problems = [random_problem(n, m, seed + i) for i in range(instances)]
+    run = lambda: solve_instances(problems, pop_size, generations, patience=generations + 1, rng=seed)
+    return {f"n={n} m={m} pop={pop_size} | solve_instances x{instances}": dict(
+        measure(run, instances * generations, min_time=0, repeat=1), unit="inst-gens/s")}
+
+def run_benchmarks(sizes=SIZES, pop_sizes=POP_SIZES, elitisms=ELITISMS, generations=20, seed=0, verbose=True):
+    entries = {}
+    for n, m in sizes:
+        for pop_size in pop_sizes:
+            entries.update(benchmark_operators(n, m, pop_size, seed))
+            for elitism in elitisms:
+                if elitism < pop_size:
+                    entries.update(benchmark_runs(n, m, pop_size, elitism, generations, seed))
+            if n <= SMALL_INSTANCE:
+                entries.update(benchmark_instances(n, m, pop_size, generations=generations, seed=seed))
+            if verbose:
+                print(f"Benchmarked n={n} m={m} pop={pop_size}")
+    return entries
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path, tag, entries):
+    baselines = load_baselines(path)
+    baselines[tag] = entries
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+def compare(entries, baseline, threshold=0.2):
+    """Relative slowdown of every entry against the baseline, and the entries slower by more than `threshold`."""
+    changes = {name: entry["seconds"] / baseline[name]["seconds"] - 1 for name, entry in entries.items() if name in baseline}
+    regressions = {name: change for name, change in changes.items() if change > threshold}
+    return changes, regressions
+
+def print_report(entries, changes=None, regressions=None):
+    changes, regressions = changes or {}, regressions or {}
+    width = max(len(name) for name in entries)
+    for name, entry in entries.items():
+        line = (f"{name:<{width}}  {entry['seconds'] * 1e3:>10.3f} ms  {entry['throughput']:>12.1f} {entry['unit']:<14}"
+                f"{entry['peak_bytes'] / 2**20:>9.2f} MiB")
+        if name in changes:
+            line += f"  {changes[name]:+7.1%}" + ("  REGRESSION" if name in regressions else "")
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="benchmark small instances only")
+    parser.add_argument("--generations", type=int, default=20, help="generations per genetic_algorithm run")
+    parser.add_argument("--baselines", default="benchmark_baselines.json", help="file holding the baseline of every machine")
+    parser.add_argument("--save", action="store_true", help="store the results as this machine's baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.quick:
+        entries = run_benchmarks(QUICK_SIZES, QUICK_POP_SIZES, QUICK_ELITISMS, args.generations)
+    else:
+        entries = run_benchmarks(generations=args.generations)
+    tag = machine_tag()
+    baseline = load_baselines(args.baselines).get(tag)
+    if baseline is None:
+        print(f"No baseline for {tag}")
+        print_report(entries)
+    else:
+        changes, regressions = compare(entries, baseline, args.threshold)
+        print_report(entries, changes, regressions)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%} against the baseline for {tag}")
+    if args.save:
+        save_baseline(args.baselines, tag, entries)
+        print(f"Saved the baseline for {tag} to {args.baselines}")
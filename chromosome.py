@@ -0,0 +1,51 @@
+import numpy as np
+from problem import get_problem
+from profiling import count
+from fitness_cache import memoized
+
+def _fitness(genes):
+    count("fitness_evaluations")
+    problem = get_problem()
+    return np.sum(problem.affinity(problem.students, genes))
+
+class Chromosome:
+    """
+    Group assignment of every student together with its group counts and fitness.
+
+    Moves and swaps keep `counts` and `fitness` up to date with O(1) deltas, so a
+    chromosome is only ever scored in full once, when it is created.
+    """
+    __slots__ = ("genes", "counts", "fitness")
+
+    def __init__(self, genes, counts=None, fitness=None):
+        problem = get_problem()
+        self.genes = genes
+        self.counts = np.bincount(genes, minlength=problem.m) if counts is None else counts
+        self.fitness = memoized(genes, _fitness) if fitness is None else fitness
+
+    def move(self, student, group):
+        problem = get_problem()
+        old_group = self.genes[student]
+        self.fitness += problem.affinity(student, group) - problem.affinity(student, old_group)
+        self.counts[old_group] -= 1
+        self.counts[group] += 1
+        self.genes[student] = group
+
+    def move_many(self, students, groups):
+        """Move several distinct students at once."""
+        problem = get_problem()
+        old_groups = self.genes[students]
+        self.fitness += np.sum(problem.affinity(students, groups)) - np.sum(problem.affinity(students, old_groups))
+        np.subtract.at(self.counts, old_groups, 1)
+        np.add.at(self.counts, groups, 1)
+        self.genes[students] = groups
+
+    def swap(self, student1, student2):
+        problem = get_problem()
+        group1, group2 = self.genes[student1], self.genes[student2]
+        self.fitness += (problem.affinity(student1, group2) + problem.affinity(student2, group1)
+                         - problem.affinity(student1, group1) - problem.affinity(student2, group2))
+        self.genes[student1], self.genes[student2] = group2, group1
+
+    def copy(self):
+        return Chromosome(self.genes.copy(), self.counts.copy(), self.fitness)
@@ -1,38 +1,41 @@
 import numpy as np
-import random
-from helpers import repair_balance
-from parameters import n, affinity_matrix
-from genetic_operations import fitness
+from helpers import repair_balance, repair_balance_batch, random_valid_groups
+from problem import get_problem
+from genetic_operations import fitness, population_fitness
+from chromosome import Chromosome
 
 # Crossover: Single-point crossover
-def single_point_crossover(parent1, parent2):
-    point = random.randint(1, n - 1)
-    child1 = np.vstack((parent1[:point], parent2[point:]))
-    child2 = np.vstack((parent2[:point], parent1[point:]))
-    return repair_balance(child1), repair_balance(child2)
-
-def uniform_crossover(parent1, parent2):
-    mask = np.random.randint(0, 2, parent1.shape, dtype=bool)  # Random binary mask
+def single_point_crossover(parent1, parent2, rng=None):
+    point = np.random.default_rng(rng).integers(1, len(parent1))
+    child1 = np.concatenate((parent1[:point], parent2[point:]))
+    child2 = np.concatenate((parent2[:point], parent1[point:]))
+    return repair_balance(Chromosome(child1)), repair_balance(Chromosome(child2))
+
+def uniform_crossover(parent1, parent2, rng=None):
+    mask = np.random.default_rng(rng).random(parent1.shape) < 0.5  # Random binary mask
     child1 = np.where(mask, parent1, parent2)
     child2 = np.where(mask, parent2, parent1)
-    return repair_balance(child1), repair_balance(child2)
+    return repair_balance(Chromosome(child1)), repair_balance(Chromosome(child2))
 
-def bernouilli_crossover(parent1, parent2):
+def bernouilli_crossover(parent1, parent2, fitness1=None, fitness2=None, rng=None):
     """
     Perform uniform crossover with a binary mask influenced by parent fitness.
 
     Args:
         parent1: The first parent chromosome (numpy array).
         parent2: The second parent chromosome (numpy array).
-        fitness1: Fitness score of the first parent.
-        fitness2: Fitness score of the second parent.
+        fitness1: Fitness score of the first parent (computed if not given).
+        fitness2: Fitness score of the second parent (computed if not given).
+        rng: The np.random.Generator to draw from.
 
     Returns:
         Two children after crossover.
     """
     # Calculate selection probabilities based on fitness
-    fitness1 = fitness(parent1)
-    fitness2 = fitness(parent2)
+    if fitness1 is None:
+        fitness1 = fitness(parent1)
+    if fitness2 is None:
+        fitness2 = fitness(parent2)
     total_fitness = fitness1 + fitness2
     if total_fitness == 0:  # Avoid division by zero
         prob_parent1 = 0.5
@@ -40,115 +43,98 @@ def bernouilli_crossover(parent1, parent2):
         prob_parent1 = fitness1 / total_fitness
 
     # Generate a probabilistic binary mask based on parent fitness
-    mask = np.random.rand(*parent1.shape) < prob_parent1
+    mask = np.random.default_rng(rng).random(parent1.shape) < prob_parent1
 
     # Create children using the mask
     child1 = np.where(mask, parent1, parent2)
     child2 = np.where(mask, parent2, parent1)
 
     # Ensure the children respect group size constraints
-    return repair_balance(child1), repair_balance(child2)
+    return repair_balance(Chromosome(child1)), repair_balance(Chromosome(child2))
 
 
-def two_point_crossover(parent1, parent2):
-    point1, point2 = sorted(random.sample(range(n), 2))
-    child1 = np.vstack((parent1[:point1], parent2[point1:point2], parent1[point2:]))
-    child2 = np.vstack((parent2[:point1], parent1[point1:point2], parent2[point2:]))
-    return repair_balance(child1), repair_balance(child2)
+def two_point_crossover(parent1, parent2, rng=None):
+    point1, point2 = np.sort(np.random.default_rng(rng).choice(len(parent1), 2, replace=False))
+    child1 = np.concatenate((parent1[:point1], parent2[point1:point2], parent1[point2:]))
+    child2 = np.concatenate((parent2[:point1], parent1[point1:point2], parent2[point2:]))
+    return repair_balance(Chromosome(child1)), repair_balance(Chromosome(child2))
 
-def heuristic_crossover(parent1, parent2):
+def heuristic_crossover(parent1, parent2, rng=None):
     """
     Perform heuristic crossover using the affinity matrix.
     Each student is assigned to the group from the parent with higher affinity.
     """
-    child = np.zeros_like(parent1, dtype=int)  # Initialize empty child chromosome
-
-    for student in range(n):
-        # Get the groups assigned in both parents
-        group_parent1 = np.where(parent1[student] == 1)[0][0]
-        group_parent2 = np.where(parent2[student] == 1)[0][0]
-
-        # Compare affinity values
-        affinity1 = affinity_matrix[student, group_parent1]
-        affinity2 = affinity_matrix[student, group_parent2]
-
-        # Assign the group from the parent with higher affinity
-        if affinity1 > affinity2:
-            child[student, group_parent1] = 1
-        elif affinity2 > affinity1:
-            child[student, group_parent2] = 1
-        else:
-            # If affinity values are equal, randomly pick one parent's assignment
-            chosen_group = random.choice([group_parent1, group_parent2])
-            child[student, chosen_group] = 1
+    problem = get_problem()
+    affinity1 = problem.affinity(problem.students, parent1)
+    affinity2 = problem.affinity(problem.students, parent2)
+
+    # Take parent1's group where its affinity is higher; break ties with a coin flip
+    coin = np.random.default_rng(rng).random(problem.n) < 0.5
+    child = np.where((affinity1 > affinity2) | ((affinity1 == affinity2) & coin), parent1, parent2)
 
     # Ensure the child respects the group size constraints
-    child = repair_balance(child)
+    child = repair_balance(Chromosome(child))
 
     # Return two identical children (to match the algorithm structure)
     return child, child  # Both children are the same
 
-def heuristic_crossover2(parent1, parent2, k=37):
+def _group_mean_affinity(problem, parent):
+    # Mean affinity of the members of every group (nan for empty groups)
+    m = problem.m
+    totals = np.bincount(parent, weights=problem.affinity(problem.students, parent), minlength=m)
+    sizes = np.bincount(parent, minlength=m)
+    return np.divide(totals, sizes, out=np.full(m, np.nan), where=sizes > 0)
+
+def _lowest_in_group(problem, parent, k):
+    # Mask of the k lowest-affinity members of every group, using the precomputed ranks
+    students = problem.students
+    order = np.lexsort((problem.rank(students, parent), parent))
+    sizes = np.bincount(parent, minlength=problem.m)
+    position = np.empty(problem.n, dtype=np.intp)
+    position[order] = students - (np.cumsum(sizes) - sizes)[parent[order]]
+    return position < k
+
+def heuristic_crossover2(parent1, parent2, k=37, rng=None):
     """
     Perform heuristic crossover using the affinity matrix.
     Students with lower affinity in a group are reassigned to better-matching groups.
 
+    Groups are visited in order and a student keeps the first assignment it gets; this
+    is computed for all students at once from each parent's claim on them.
+
     Args:
         parent1: The first parent chromosome.
         parent2: The second parent chromosome.
-        affinity_matrix: Matrix where entry (i, j) represents the affinity of student i for group j.
         k: Number of students with the lowest affinity to consider for reassignment.
+        rng: The np.random.Generator to draw from.
 
     Returns:
         Two identical children after crossover.
     """
-    n, m = affinity_matrix.shape  # Number of students and groups
-    child = np.zeros_like(parent1, dtype=int)  # Initialize the child chromosome
-
-    assigned_students = set()  # Track students already assigned to avoid duplicates
-
-    for group in range(m):
-        # Step 1: Calculate average affinity for this group in both parents
-        avg_affinity_parent1 = np.mean([affinity_matrix[student, group] for student in range(n) if parent1[student, group] == 1])
-        avg_affinity_parent2 = np.mean([affinity_matrix[student, group] for student in range(n) if parent2[student, group] == 1])
-
-        # Step 2: Select the parent group with the lower affinity
-        low_affinity_parent = parent1 if avg_affinity_parent1 < avg_affinity_parent2 else parent2
-        high_affinity_parent = parent2 if avg_affinity_parent1 < avg_affinity_parent2 else parent1
-
-        # Step 3: Identify k students with the lowest affinity in the low-affinity parent group
-        group_students = [student for student in range(n) if low_affinity_parent[student, group] == 1]
-        student_affinities = [(student, affinity_matrix[student, group]) for student in group_students]
-        student_affinities.sort(key=lambda x: x[1])  # Sort by affinity (ascending)
-        low_affinity_students = [student for student, _ in student_affinities[:k]]
-
-        for student in low_affinity_students:
-            # Step 4: Find a better matching group for this student in the high-affinity parent
-            best_group = np.argmax(affinity_matrix[student, :])  # Group with the highest affinity for this student
-            if best_group != group and student not in assigned_students:
-                # Assign the student to the better group
-                child[student, best_group] = 1
-                assigned_students.add(student)
-
-        # Step 5: Assign remaining students in the current group from the low-affinity parent
-        for student in group_students:
-            if student not in assigned_students:
-                child[student, group] = 1
-                assigned_students.add(student)
-
-    # Step 6: Assign remaining unassigned students randomly
-    for student in range(n):
-        if student not in assigned_students:
-            random_group = random.randint(0, m - 1)  # Randomly pick a group
-            child[student, random_group] = 1
+    problem = get_problem()
+
+    # For every group, take the members of the parent whose group has the lower mean affinity
+    from_parent1 = _group_mean_affinity(problem, parent1) < _group_mean_affinity(problem, parent2)
+    claim1 = from_parent1[parent1]
+    claim2 = ~from_parent1[parent2]
+
+    # The k lowest-affinity members of each taken group move to their best group
+    target1 = np.where(_lowest_in_group(problem, parent1, k), problem.best_group, parent1)
+    target2 = np.where(_lowest_in_group(problem, parent2, k), problem.best_group, parent2)
+
+    # A student claimed by both parents gets the assignment from the group visited first;
+    # unclaimed students go to a random valid group
+    use_parent1 = claim1 & (~claim2 | (parent1 < parent2))
+    random_groups = random_valid_groups(problem.n, rng).astype(parent1.dtype)
+    child = np.where(use_parent1, target1, np.where(claim2, target2, random_groups))
 
     # Ensure the child respects the group size constraints
-    child = repair_balance(child)
+    child = repair_balance(Chromosome(child))
 
     # Return two identical children (to match the algorithm structure)
     return child, child
 
-def stochastic_heuristic_crossover(parent1, parent2, k=8, randomness=0.2):
+def stochastic_heuristic_crossover(parent1, parent2, k=8, randomness=0.2, rng=None):
     """
     Perform stochastic heuristic crossover using the affinity matrix.
     Introduces randomness in decision-making to increase diversity.
@@ -158,62 +144,115 @@ def stochastic_heuristic_crossover(parent1, parent2, k=8, randomness=0.2):
         parent2: The second parent chromosome.
         k: Number of students with the lowest affinity to consider for reassignment.
         randomness: Probability of making a random choice instead of the heuristic decision.
+        rng: The np.random.Generator to draw from.
 
     Returns:
         Two identical children after crossover.
     """
-    n, m = affinity_matrix.shape  # Number of students and groups
-    child = np.zeros_like(parent1, dtype=int)  # Initialize the child chromosome
-
-    assigned_students = set()  # Track students already assigned to avoid duplicates
-
-    for group in range(m):
-        # Step 1: Calculate average affinity for this group in both parents
-        avg_affinity_parent1 = np.mean([affinity_matrix[student, group] for student in range(n) if parent1[student, group] == 1])
-        avg_affinity_parent2 = np.mean([affinity_matrix[student, group] for student in range(n) if parent2[student, group] == 1])
-
-        # Step 2: Stochastically decide whether to use high or low affinity group
-        if random.random() < randomness:
-            # Randomly pick one parent's group assignments
-            selected_parent = random.choice([parent1, parent2])
-        else:
-            # Select the low-affinity group deterministically
-            selected_parent = parent1 if avg_affinity_parent1 < avg_affinity_parent2 else parent2
-
-        # Step 3: Identify k students with the lowest affinity in the selected group
-        group_students = [student for student in range(n) if selected_parent[student, group] == 1]
-        student_affinities = [(student, affinity_matrix[student, group]) for student in group_students]
-        student_affinities.sort(key=lambda x: x[1])  # Sort by affinity (ascending)
-        low_affinity_students = [student for student, _ in student_affinities[:k]]
-
-        for student in low_affinity_students:
-            # Step 4: Stochastically pick a better matching group or the current group
-            if random.random() < randomness:
-                # Randomly assign the student to any valid group
-                random_group = random.choice(range(m))
-                child[student, random_group] = 1
-                assigned_students.add(student)
-            else:
-                # Assign the student to the group with the highest affinity
-                best_group = np.argmax(affinity_matrix[student, :])
-                if best_group != group and student not in assigned_students:
-                    child[student, best_group] = 1
-                    assigned_students.add(student)
-
-        # Step 5: Assign remaining students in the current group deterministically
-        for student in group_students:
-            if student not in assigned_students:
-                child[student, group] = 1
-                assigned_students.add(student)
-
-    # Step 6: Assign remaining unassigned students randomly
-    for student in range(n):
-        if student not in assigned_students:
-            random_group = random.randint(0, m - 1)  # Randomly pick a group
-            child[student, random_group] = 1
+    problem = get_problem()
+    n, m = problem.n, problem.m
+    # Every draw of the operator, made up front
+    rng = np.random.default_rng(rng)
+    group_draws = rng.random((2, m))
+    student_draws = rng.random((2, n))
+    random_groups = random_valid_groups(n, rng).astype(parent1.dtype)
+
+    # For every group, take the members of a random parent or else of the low-affinity one
+    random_parent = group_draws[0] < randomness
+    from_parent1 = np.where(random_parent, group_draws[1] < 0.5,
+                            _group_mean_affinity(problem, parent1) < _group_mean_affinity(problem, parent2))
+    claim1 = from_parent1[parent1]
+    claim2 = ~from_parent1[parent2]
+
+    # Each of the k lowest-affinity members of a taken group either moves to a random
+    # valid group or, otherwise, to its best group
+    low1 = claim1 & _lowest_in_group(problem, parent1, k)
+    low2 = claim2 & _lowest_in_group(problem, parent2, k)
+    random1 = low1 & (student_draws[0] < randomness)
+    random2 = low2 & (student_draws[1] < randomness)
+    target1 = np.where(random1, random_groups, np.where(low1, problem.best_group, parent1))
+    target2 = np.where(random2, random_groups, np.where(low2, problem.best_group, parent2))
+
+    # Random moves overwrite earlier assignments, so among them the later group wins;
+    # otherwise a student keeps the assignment from the group visited first
+    use_parent1 = np.where(random1 | random2,
+                           random1 & (~random2 | (parent1 > parent2)),
+                           claim1 & (~claim2 | (parent1 < parent2)))
+    child = np.where(use_parent1, target1, np.where(claim2, target2, random_groups))
 
     # Ensure the child respects the group size constraints
-    child = repair_balance(child)
+    child = repair_balance(Chromosome(child))
 
     # Return two identical children (to match the algorithm structure)
     return child, child
+
+# Batch crossovers: parents1 and parents2 are (pairs, n) stacks and every child of a
+# generation is built and repaired with a few array operations. With `out`, a
+# (2 * pairs, n) stack, the children are written into it interleaved (the two children
+# of pair i in rows 2i and 2i + 1) instead of into new arrays, and with `draws` and
+# `mask`, float and bool stacks of at least `pairs` rows, the random draws and the
+# crossover mask are made in those. The per-pair functions above remain the reference
+# implementations.
+
+def _scratch(buffer, shape, dtype):
+    # The leading rows of the caller's buffer, or a new array
+    return np.empty(shape, dtype=dtype) if buffer is None else buffer[:shape[0]]
+
+def _batch_children(mask, parents1, parents2, out=None):
+    # Both halves are repaired in a single call; children take parent1's genes where mask is set
+    if out is None:
+        children = repair_balance_batch(np.concatenate((np.where(mask, parents1, parents2), np.where(mask, parents2, parents1))))
+        return children[:len(parents1)], children[len(parents1):]
+    pairs = out.reshape(len(parents1), 2, -1)
+    np.copyto(pairs[:, 0], parents2)
+    np.copyto(pairs[:, 0], parents1, where=mask)
+    np.copyto(pairs[:, 1], parents1)
+    np.copyto(pairs[:, 1], parents2, where=mask)
+    repair_balance_batch(out)
+    return pairs[:, 0], pairs[:, 1]
+
+def single_point_crossover_batch(parents1, parents2, rng=None, out=None, draws=None, mask=None):
+    n = parents1.shape[1]
+    points = np.random.default_rng(rng).integers(1, n, size=len(parents1))
+    mask = _scratch(mask, parents1.shape, bool)
+    np.less(np.arange(n), points[:, None], out=mask)
+    return _batch_children(mask, parents1, parents2, out)
+
+def uniform_crossover_batch(parents1, parents2, rng=None, out=None, draws=None, mask=None):
+    draws, mask = _scratch(draws, parents1.shape, float), _scratch(mask, parents1.shape, bool)
+    np.random.default_rng(rng).random(out=draws)
+    np.less(draws, 0.5, out=mask)
+    return _batch_children(mask, parents1, parents2, out)
+
+def bernouilli_crossover_batch(parents1, parents2, fitness1=None, fitness2=None, rng=None, out=None, draws=None, mask=None):
+    if fitness1 is None:
+        fitness1 = population_fitness(parents1)
+    if fitness2 is None:
+        fitness2 = population_fitness(parents2)
+    total_fitness = fitness1 + fitness2
+    prob_parent1 = np.divide(fitness1, total_fitness, out=np.full(len(parents1), 0.5), where=total_fitness != 0)
+    draws, mask = _scratch(draws, parents1.shape, float), _scratch(mask, parents1.shape, bool)
+    np.random.default_rng(rng).random(out=draws)
+    np.less(draws, prob_parent1[:, None], out=mask)
+    return _batch_children(mask, parents1, parents2, out)
+
+def two_point_crossover_batch(parents1, parents2, rng=None, out=None, draws=None, mask=None):
+    # Two distinct points per pair; genes between them come from the other parent
+    rng = np.random.default_rng(rng)
+    n = parents1.shape[1]
+    point1 = rng.integers(n, size=len(parents1))
+    point2 = rng.integers(n - 1, size=len(parents1))
+    point2 += point2 >= point1
+    point1, point2 = np.minimum(point1, point2), np.maximum(point1, point2)
+    students = np.arange(n)
+    mask = _scratch(mask, parents1.shape, bool)
+    np.less(students, point1[:, None], out=mask)
+    mask |= students >= point2[:, None]
+    return _batch_children(mask, parents1, parents2, out)
+
+batch_crossover_methods = {
+    single_point_crossover: single_point_crossover_batch,
+    uniform_crossover: uniform_crossover_batch,
+    bernouilli_crossover: bernouilli_crossover_batch,
+    two_point_crossover: two_point_crossover_batch,
+}
@@ -0,0 +1,66 @@
+import numpy as np
+from local_search import fold_moves
+
+def solve_balanced_assignment(problem):
+    """
+    The optimal balanced assignment of `problem`: maximum total affinity with exactly
+    group_size students in every group, using positive-affinity groups only.
+
+    Solved as a min-cost flow by successive shortest paths. Students are added one at
+    a time along the cheapest path that places them in a group and may shift already
+    assigned students on to other groups, until one with room is reached. Each
+    partial assignment is optimal for the students it holds, so the final one is
+    optimal. Paths run over the m groups only: moving on from group a to group b
+    costs the best exchange -max(A[i, b] - A[i, a]) over the members i of a, the
+    same table swap_local_search keeps, updated only for the groups a path touched.
+    """
+    n, m, capacity = problem.n, problem.m, problem.group_size
+    if n != m * capacity:
+        raise ValueError(f"{n} students cannot fill {m} groups of {capacity}")
+    indptr, option_groups, option_affinities = problem.options
+    genes = np.full((1, n), -1, dtype=np.intp)
+    best_gain = np.full((1, m, m), -np.inf)
+    best_student = np.zeros((1, m, m), dtype=np.intp)
+    room = np.full(m, capacity)
+    no_rows = np.zeros(n, dtype=np.intp)
+
+    for student in range(n):
+        # Cost of reaching every group, directly or by shifting members along exchanges
+        distance = np.full(m, np.inf)
+        options = slice(indptr[student], indptr[student + 1])
+        distance[option_groups[options]] = -option_affinities[options]
+        previous = np.full(m, -1)
+        exchange = -best_gain[0]
+        for _ in range(m):  # Bellman-Ford; optimal partial assignments leave no negative cycles
+            through = distance[:, None] + exchange
+            via = np.argmin(through, axis=0)
+            shorter = through[via, np.arange(m)] < distance - 1e-12
+            if not np.any(shorter):
+                break
+            distance[shorter] = through[via, np.arange(m)][shorter]
+            previous[shorter] = via[shorter]
+
+        reachable = np.where(room > 0, distance, np.inf)
+        group = np.argmin(reachable)
+        if not np.isfinite(reachable[group]):
+            raise ValueError(f"Student {student} cannot be placed in any group with room")
+        room[group] -= 1
+
+        # Walk the path back from the group with room, shifting one member per step
+        path = [group]
+        while previous[group] >= 0:
+            genes[0, best_student[0, previous[group], group]] = group
+            group = previous[group]
+            path.append(group)
+        genes[0, student] = group
+
+        # Only the groups on the path changed members
+        best_gain[0, path] = -np.inf
+        members = np.nonzero(np.isin(genes[0], path))[0]
+        fold_moves(problem, genes, no_rows[:len(members)], members, best_gain, best_student)
+
+    return genes[0].astype(problem.gene_dtype)
+
+def optimality_gaps(results, optimum):
+    """Relative gap between the optimum and each method's mean best fitness."""
+    return {method_name: (optimum - np.mean(data["best_fitness"])) / optimum for method_name, data in results.items()}
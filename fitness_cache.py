@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from profiling import count
+
+class FitnessMemo:
+    """
+    Bounded LRU map from chromosome contents to fitness.
+
+    Chromosomes are keyed by a 16-byte digest of their gene bytes, so equal assignments
+    share one entry whatever object holds them and an entry takes the same memory
+    whatever n is; the least recently used entry is dropped once `maxsize` are stored.
+
+    With the built-in fitness, a vectorized affinity sum, the memo saves evaluations
+    but not wall time: full evaluations are a small share of a generation, and most
+    children are new, so lookups rarely hit. It only saves time with slow evaluators.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    @staticmethod
+    def key(genes):
+        return hashlib.blake2b(np.ascontiguousarray(genes), digest_size=16).digest()
+
+    def get(self, key):
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            count("memo_misses")
+        else:
+            self.hits += 1
+            count("memo_hits")
+            self._scores.move_to_end(key)
+        return score
+
+    def put(self, key, score):
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        if len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def put_population(self, population, scores):
+        for genes, score in zip(population, scores):
+            self.put(self.key(genes), score)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._scores)
+
+class _State(threading.local):
+    memo = None
+
+# The memo of the run on this thread; fitness evaluations go through memoized()
+_state = _State()
+
+def active_memo():
+    return _state.memo
+
+@contextmanager
+def use_memo(memo):
+    """Route fitness evaluations through `memo` (None for none) for the duration of the block."""
+    previous = _state.memo
+    _state.memo = memo
+    try:
+        yield memo
+    finally:
+        _state.memo = previous
+
+def memoized(genes, evaluate):
+    """evaluate(genes), or the score the active memo holds for the same genes."""
+    memo = _state.memo
+    if memo is None:
+        return evaluate(genes)
+    key = memo.key(genes)
+    score = memo.get(key)
+    if score is None:
+        score = evaluate(genes)
+        memo.put(key, score)
+    return score
+
+def memoized_batch(population, evaluate):
+    """evaluate(population) for a (k, n) stack, computing only the rows the active memo misses."""
+    memo = _state.memo
+    if memo is None:
+        return evaluate(population)
+    keys = [memo.key(genes) for genes in population]
+    known = [memo.get(key) for key in keys]
+    missing = np.array([score is None for score in known], dtype=bool)
+    scores = np.array([np.nan if score is None else score for score in known], dtype=float)
+    if np.any(missing):
+        scores[missing] = evaluate(population[missing])
+        for key, score in zip((key for key, miss in zip(keys, missing) if miss), scores[missing]):
+            memo.put(key, score)
+    return scores
+
+def distinct_rows(population):
+    """Index of the first occurrence of every distinct chromosome in a (k, n) stack, in order."""
+    _, first = np.unique(population, axis=0, return_index=True)
+    return np.sort(first)
@@ -1,52 +1,391 @@
-from helpers import initialize_population
+import os
+import json
+import inspect
+from helpers import initialize_population, population_counts
 from genetic_operations import *
 from crossover_methods import *
+from chromosome import Chromosome
+from profiling import activate, phase, count
+from problem import get_problem
+from local_search import swap_local_search
+from fitness_cache import FitnessMemo, use_memo, active_memo, distinct_rows
+from result_store import describe
 
-def genetic_algorithm(pop_size=50, generations=100, mutation_rate=0.1, elitism=1, patience=10, crossover_method=None, select=tournament_selection):
-    population = initialize_population(pop_size)
-    no_improvement = 0
-    best_fitness = float('-inf')
-    avg_fitness_progress = []  # To store average fitness per generation
+def random_population(pop_size, rng=None, seed_fraction=0.0):
+    """A fresh random population of Chromosomes, scored in one batched call."""
+    initial_population = np.array(initialize_population(pop_size, rng, seed_fraction))
+    return [Chromosome(genes, fitness=score) for genes, score in zip(initial_population, population_fitness(initial_population))]
 
+def _takes_rng(function):
+    # Operators from outside this package may not accept a generator
+    return "rng" in inspect.signature(function).parameters
 
-    for generation in range(generations):
-        fitness_scores = [fitness(chrom) for chrom in population]
-        avg_fitness = np.mean(fitness_scores)
-        avg_fitness_progress.append(avg_fitness)  # Track average fitness
-        max_fitness = max(fitness_scores)
+class PopulationArena:
+    """
+    The population of a run in preallocated buffers: two gene stacks, with their group
+    counts and scores, of which one holds the current population while the next one is
+    bred into the other, and scratch stacks for the parents of a generation and for
+    the random draws and mask of a batch crossover.
 
-        if max_fitness > best_fitness:
-            best_fitness = max_fitness
-            no_improvement = 0
+    Every buffer has pop_size + 1 rows; the extra one takes the second child of the last
+    pair when pop_size - elitism is odd. `genes`, `counts` and `scores` view the current
+    population, `next_genes`, `next_counts` and `next_scores` the full other buffer.
+    """
+
+    def __init__(self, pop_size):
+        problem = get_problem()
+        self.pop_size = pop_size
+        self._genes = np.empty((2, pop_size + 1, problem.n), dtype=problem.gene_dtype)
+        self._counts = np.empty((2, pop_size + 1, problem.m), dtype=np.intp)
+        self._scores = np.empty((2, pop_size + 1))
+        self.parents = np.empty((2, -(-pop_size // 2), problem.n), dtype=problem.gene_dtype)
+        self.draws = np.empty((-(-pop_size // 2), problem.n))
+        self.mask = np.empty((-(-pop_size // 2), problem.n), dtype=bool)
+        self.current = 0
+
+    @property
+    def genes(self):
+        return self._genes[self.current, :self.pop_size]
+
+    @property
+    def counts(self):
+        return self._counts[self.current, :self.pop_size]
+
+    @property
+    def scores(self):
+        return self._scores[self.current, :self.pop_size]
+
+    @property
+    def next_genes(self):
+        return self._genes[1 - self.current]
+
+    @property
+    def next_counts(self):
+        return self._counts[1 - self.current]
+
+    @property
+    def next_scores(self):
+        return self._scores[1 - self.current]
+
+    def swap(self):
+        """Make the bred population the current one."""
+        self.current = 1 - self.current
+
+    def load(self, genes, scores, counts=None):
+        """Copy a (pop_size, n) stack and its scores in as the current population."""
+        self.genes[...] = genes
+        self.scores[...] = scores
+        self.counts[...] = population_counts(self.genes) if counts is None else counts
+
+    def chromosomes(self):
+        """The current population as Chromosomes viewing the arena's rows."""
+        return [Chromosome(genes, counts, score) for genes, counts, score in zip(self.genes, self.counts, self.scores)]
+
+def breed(arena, mutation_rate=0.1, elitism=1, crossover_method=None, select=tournament_selection, rng=None,
+          local_search=None, local_search_budget=None, deduplicate=None):
+    """
+    Breed the next population of a PopulationArena from its current one, writing elites
+    and children straight into the arena's next buffers; arena.swap() makes it current.
+    The options are those of next_generation.
+    """
+    rng = np.random.default_rng(rng)
+    pop_size = arena.pop_size
+    genes, fitness_scores = arena.genes, arena.scores
+    out_genes, out_counts, out_scores = arena.next_genes, arena.next_counts, arena.next_scores
+    # Known crossovers build all children of a generation at once
+    batch_crossover = batch_crossover_methods.get(crossover_method)
+    # Crossovers that accept the parents' scores get them instead of recomputing them
+    pass_fitness = "fitness1" in inspect.signature(batch_crossover or crossover_method).parameters
+    # Known selection methods pick all parents of a generation in one vectorized call
+    batch_select = batch_selection_methods.get(select)
+
+    # Elitism: Copy the best individuals over (unchanged, so never re-evaluated)
+    elitism = min(elitism, pop_size)
+    elite_indices = np.argpartition(fitness_scores, pop_size - elitism)[pop_size - elitism:] if elitism else np.empty(0, dtype=np.intp)
+    # Indices are in range; "clip" lets take write into `out` without an intermediate buffer
+    np.take(genes, elite_indices, axis=0, out=out_genes[:elitism], mode="clip")
+    np.take(arena.counts, elite_indices, axis=0, out=out_counts[:elitism], mode="clip")
+    np.take(fitness_scores, elite_indices, out=out_scores[:elitism], mode="clip")
+    if local_search == "elites":
+        with phase("local_search"):
+            # Swaps keep the group counts
+            swap_local_search(out_genes[:elitism], out_scores[:elitism], local_search_budget)
+
+    # Pick the parents of every pair, as indices so their scores stay at hand for the crossover
+    num_pairs = -(-(pop_size - elitism) // 2)
+    if num_pairs <= 0:
+        return
+    with phase("selection"):
+        if batch_select is not None:
+            count("selection_calls")
+            parent_pairs = batch_select(fitness_scores, 2 * num_pairs, rng=rng).reshape(num_pairs, 2)
         else:
-            no_improvement += 1
-
-        # Early stopping if no improvement for `patience` generations
-        if no_improvement >= patience:
-            # print(f"Early stopping at generation {generation}")
-            break
-
-        # Elitism: Select the best individuals to carry over
-        elite_indices = np.argsort(fitness_scores)[-elitism:]
-        elites = [population[i] for i in elite_indices]
-
-        # Create a new population
-        new_population = elites.copy()  # Start with elites
-        while len(new_population) < pop_size:
-            parent1 = select(population, fitness_scores)
-            parent2 = select(population, fitness_scores)
-            child1, child2 = crossover_method(parent1, parent2)  # Use the specified crossover method
-            new_population.append(mutate(child1, mutation_rate))
-            if len(new_population) < pop_size:  # Add second child only if space remains
-                new_population.append(mutate(child2, mutation_rate))
-
-        population = new_population
-        # print(f"Generation {generation}: Best fitness = {max_fitness}, Avg fitness = {avg_fitness:.2f}")
+            count("selection_calls", 2 * num_pairs)
+            indices = np.arange(pop_size)
+            select_kwargs = {"rng": rng} if _takes_rng(select) else {}
+            parent_pairs = [(select(indices, fitness_scores, **select_kwargs), select(indices, fitness_scores, **select_kwargs)) for _ in range(num_pairs)]
 
-    # Return the best solution
-    fitness_scores = [fitness(chrom) for chrom in population]
-    best_index = np.argmax(fitness_scores)
+    # Create the children in the slots after the elites; a surplus last child lands in the extra row
+    children, counts, scores = out_genes[elitism:pop_size], out_counts[elitism:pop_size], out_scores[elitism:pop_size]
+    if batch_crossover is not None:
+        with phase("crossover"):
+            count("crossover_calls")
+            first, second = np.asarray(parent_pairs).T
+            parents1 = np.take(genes, first, axis=0, out=arena.parents[0, :num_pairs], mode="clip")
+            parents2 = np.take(genes, second, axis=0, out=arena.parents[1, :num_pairs], mode="clip")
+            crossover_kwargs = {"fitness1": fitness_scores[first], "fitness2": fitness_scores[second]} if pass_fitness else {}
+            slots = out_genes[elitism:elitism + 2 * num_pairs]
+            if "mask" in inspect.signature(batch_crossover).parameters:
+                crossover_kwargs.update(draws=arena.draws, mask=arena.mask)
+            if "out" in inspect.signature(batch_crossover).parameters:
+                batch_crossover(parents1, parents2, **crossover_kwargs, rng=rng, out=slots)
+            else:
+                # Interleave the children as the per-pair loop would
+                slots.reshape(num_pairs, 2, -1).transpose(1, 0, 2)[...] = batch_crossover(parents1, parents2, **crossover_kwargs, rng=rng)
+        with phase("evaluation"):
+            counts[...] = population_counts(children)
+            scores[...] = population_fitness(children)
+    else:
+        with phase("crossover"):
+            count("crossover_calls", num_pairs)
+            crossover_kwargs = {"rng": rng} if _takes_rng(crossover_method) else {}
+            offspring = []
+            for i, j in parent_pairs:
+                if pass_fitness:
+                    offspring.extend(crossover_method(genes[i], genes[j], fitness1=fitness_scores[i], fitness2=fitness_scores[j], **crossover_kwargs))
+                else:
+                    offspring.extend(crossover_method(genes[i], genes[j], **crossover_kwargs))  # Use the specified crossover method
+            offspring = offspring[:pop_size - elitism]
+            for slot, child in enumerate(offspring):
+                # Crossovers may also return plain gene vectors, which are counted and scored here
+                if not isinstance(child, Chromosome):
+                    child = Chromosome(np.asarray(child))
+                children[slot], counts[slot], scores[slot] = child.genes, child.counts, child.fitness
+
+    # Mutate and repair every child at once
+    with phase("mutation"):
+        mutate_batch(children, mutation_rate, counts, scores, rng)
+    if local_search == "offspring":
+        with phase("local_search"):
+            swap_local_search(children, scores, local_search_budget)
+    if deduplicate is not None:
+        with phase("deduplication"):
+            _replace_duplicates(out_genes[:pop_size], elitism, out_counts[:pop_size], out_scores[:pop_size], deduplicate, rng)
+    # Children are scored incrementally; remember them for later evaluations of the same genes
+    memo = active_memo()
+    if memo is not None:
+        memo.put_population(children, scores)
+
+def next_generation(population, fitness_scores, pop_size, mutation_rate=0.1, elitism=1, crossover_method=None, select=tournament_selection, rng=None,
+                    local_search=None, local_search_budget=None, deduplicate=None):
+    """
+    Breed the next population of Chromosomes from a scored one, drawing every random number from `rng`.
+
+    `local_search` may be "elites" or "offspring", to improve those chromosomes with
+    swap_local_search, for at most `local_search_budget` seconds per generation.
+    `deduplicate` may be "fresh" or "mutate", to replace children that duplicate an elite
+    or an earlier child with a new random chromosome or a mutated copy of the clone
+    (or, if the mutated copy is still a clone, a new random one).
+    Runs that breed many generations keep one PopulationArena and call breed instead.
+    """
+    arena = PopulationArena(pop_size)
+    arena.load(np.array([chrom.genes for chrom in population]), fitness_scores, np.array([chrom.counts for chrom in population]))
+    breed(arena, mutation_rate, elitism, crossover_method, select, rng, local_search, local_search_budget, deduplicate)
+    arena.swap()
+    return arena.chromosomes()
+
+def _clones(population, elitism):
+    # Children (the rows after the elites) equal to an elite or to an earlier child
+    return np.setdiff1d(np.arange(elitism, len(population)), distinct_rows(population)) - elitism
 
+def _replace_duplicates(population, elitism, counts, scores, mode, rng):
+    # Clones among the children are replaced in place; mutated clones that are still
+    # clones (mutations of copies of one elite can coincide) get fresh chromosomes
+    if mode not in ("fresh", "mutate"):
+        raise ValueError(f"Unknown deduplication mode: {mode!r}")
+    children, counts, scores = population[elitism:], counts[elitism:], scores[elitism:]
+    clones = _clones(population, elitism)
+    if not clones.size:
+        return
+    found = len(clones)
+    if mode == "mutate":
+        replacements, replacement_counts, replacement_scores = children[clones], counts[clones], scores[clones]
+        mutate_batch(replacements, 1.0, replacement_counts, replacement_scores, rng)
+        children[clones], counts[clones], scores[clones] = replacements, replacement_counts, replacement_scores
+        clones = _clones(population, elitism)
+    if clones.size:
+        replacements = initialize_population(len(clones), rng)
+        children[clones], counts[clones], scores[clones] = replacements, population_counts(replacements), population_fitness(replacements)
+        clones = _clones(population, elitism)
+    count("duplicates_replaced", found - len(clones))
 
+class Evolution:
+    """
+    A GA run that can be iterated one generation at a time, checkpointed and resumed.
 
-    return population[best_index], avg_fitness_progress
\ No newline at end of file
+    Iterating scores the current population, yields its state and breeds the next one,
+    until `generations` generations have been scored or the best fitness has not
+    improved for `patience` of them. Every yielded state is a dict with the
+    "generation" number, the "population" of Chromosomes, their "fitness_scores", the
+    "best" chromosome of the population, the "best_fitness" and "mean_fitness", and
+    the "no_improvement" counter. The caller may stop iterating at any point.
+
+    The population lives in a PopulationArena (`arena`) whose two buffers take turns,
+    and the parents and batch crossover masks of a generation go to its scratch
+    buffers. Breeding still allocates temporaries: counting and scoring work in blocks
+    of helpers.BLOCK_ELEMENTS, but repair allocates arrays over every student of an
+    over-full group, several times the gene buffer while children are far from
+    balanced, and mutation, selection and per-pair crossovers allocate their own. The yielded
+    "population" and "best" view the arena and are overwritten when the generation
+    after the next one is bred; copy them to keep them.
+
+    `local_search` and `local_search_budget` add a memetic step (see next_generation), and
+    `seed_fraction` starts that share of the population from the exact optimum (see
+    initialize_population). With a `memo_size`, fitness evaluations go through a
+    FitnessMemo of that many entries (`memo`; it only saves time with slow evaluators),
+    and `deduplicate` replaces clones (see next_generation).
+    With a `checkpoint_path`, the population, generator state, early-stopping counters
+    and progress history are saved there every `checkpoint_every` generations; an
+    Evolution created with the same arguments and an existing checkpoint file resumes
+    from it and continues exactly as the interrupted run would have.
+    """
+
+    def __init__(self, pop_size=50, generations=100, mutation_rate=0.1, elitism=1, patience=10, crossover_method=None,
+                 select=tournament_selection, rng=None, profile=None, checkpoint_path=None, checkpoint_every=10,
+                 local_search=None, local_search_budget=None, seed_fraction=0.0, memo_size=None, deduplicate=None):
+        self.pop_size, self.generations, self.patience = pop_size, generations, patience
+        self.breeding = dict(mutation_rate=mutation_rate, elitism=elitism, crossover_method=crossover_method, select=select,
+                             local_search=local_search, local_search_budget=local_search_budget, deduplicate=deduplicate)
+        self.memo = None if memo_size is None else FitnessMemo(memo_size)
+        self.rng = np.random.default_rng(rng)
+        self.profile = profile
+        self.checkpoint_path, self.checkpoint_every = checkpoint_path, checkpoint_every
+        self.generation = 0
+        self.no_improvement = 0
+        self.best_fitness = float('-inf')
+        self.avg_fitness_progress = []  # To store average fitness per generation
+        self.arena = PopulationArena(pop_size)
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
+        else:
+            with activate(profile), use_memo(self.memo), phase("initialization"):
+                genes = initialize_population(pop_size, self.rng, seed_fraction)
+                self.arena.load(genes, population_fitness(genes))
+
+    @property
+    def population(self):
+        """The current population, as Chromosomes viewing the arena."""
+        return self.arena.chromosomes()
+
+    def __iter__(self):
+        profile = self.profile
+        while self.generation < self.generations:
+            generation = self.generation
+            # Every chromosome carries its fitness, updated incrementally by the operators
+            fitness_scores = self.arena.scores.copy()
+            avg_fitness = np.mean(fitness_scores)
+            self.avg_fitness_progress.append(avg_fitness)  # Track average fitness
+            best_index = np.argmax(fitness_scores)
+            max_fitness = fitness_scores[best_index]
+            if profile is not None:
+                profile.end_generation(generation, fitness_scores, self.arena.genes)
+
+            if max_fitness > self.best_fitness:
+                self.best_fitness = max_fitness
+                self.no_improvement = 0
+            else:
+                self.no_improvement += 1
+
+            population = self.population
+            yield {
+                "generation": generation,
+                "population": population,
+                "fitness_scores": fitness_scores,
+                "best": population[best_index],
+                "best_fitness": self.best_fitness,
+                "mean_fitness": avg_fitness,
+                "no_improvement": self.no_improvement,
+            }
+
+            # Early stopping if no improvement for `patience` generations
+            if self.no_improvement >= self.patience:
+                if profile is not None:
+                    profile.stopped_at = generation
+                # print(f"Early stopping at generation {generation}")
+                return
+
+            with activate(profile), use_memo(self.memo):
+                breed(self.arena, rng=self.rng, **self.breeding)
+            self.arena.swap()
+            self.generation += 1
+            # print(f"Generation {generation}: Best fitness = {max_fitness}, Avg fitness = {avg_fitness:.2f}")
+            if self.checkpoint_path is not None and self.generation % self.checkpoint_every == 0:
+                self.save_checkpoint(self.checkpoint_path)
+
+    def best(self):
+        """A copy of the best chromosome of the current population."""
+        return self.population[np.argmax(self.arena.scores)].copy()
+
+    def _settings(self):
+        # What a checkpoint must have been made with to be resumed: the instance and the breeding arguments
+        settings = {"problem": get_problem().fingerprint, "pop_size": self.pop_size}
+        settings.update((name, describe(value)) for name, value in self.breeding.items())
+        return settings
+
+    def save_checkpoint(self, path):
+        # Written to a temporary file first, so a crash never leaves a truncated checkpoint
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez_compressed(
+                f,
+                genes=self.arena.genes,
+                fitness=self.arena.scores,
+                rng_state=np.array(json.dumps(self.rng.bit_generator.state)),
+                generation=self.generation,
+                no_improvement=self.no_improvement,
+                best_fitness=self.best_fitness,
+                avg_fitness_progress=np.array(self.avg_fitness_progress, dtype=float),
+                settings=np.array(json.dumps(self._settings(), sort_keys=True)),
+            )
+        os.replace(temporary, path)
+
+    def load_checkpoint(self, path):
+        with np.load(path) as checkpoint:
+            # A checkpoint of another instance or other settings would resume with stale scores
+            if "settings" not in checkpoint:
+                raise ValueError(f"Checkpoint {path} does not record the instance and settings it was made with")
+            saved, settings = json.loads(str(checkpoint["settings"])), self._settings()
+            mismatched = sorted(name for name in saved.keys() | settings.keys() if saved.get(name) != settings.get(name))
+            if mismatched:
+                raise ValueError(f"Checkpoint {path} was made with different {', '.join(mismatched)}")
+            genes = checkpoint["genes"]
+            # Scores are restored rather than recomputed, so they match the interrupted run bit for bit
+            self.arena.load(genes, checkpoint["fitness"])
+            self.rng.bit_generator.state = json.loads(str(checkpoint["rng_state"]))
+            self.generation = int(checkpoint["generation"])
+            self.no_improvement = int(checkpoint["no_improvement"])
+            self.best_fitness = float(checkpoint["best_fitness"])
+            self.avg_fitness_progress = list(checkpoint["avg_fitness_progress"])
+
+def genetic_algorithm(pop_size=50, generations=100, mutation_rate=0.1, elitism=1, patience=10, crossover_method=None, select=tournament_selection,
+                      rng=None, profile=None, checkpoint_path=None, checkpoint_every=10, local_search=None, local_search_budget=None,
+                      seed_fraction=0.0, memo_size=None, deduplicate=None):
+    """
+    Evolve a population and return its best chromosome and average fitness per generation.
+
+    `rng` is the run's np.random.Generator, or a seed for one. Every random draw of the
+    run comes from it, so runs with equal seeds are identical even when they share a process.
+    `profile`, a profiling.RunProfile, collects per-generation phase times and counters.
+    With a `checkpoint_path` the run is checkpointed, and resumed if the file exists (see Evolution).
+    `local_search` ("elites" or "offspring") adds a swap local-search step to every generation,
+    and `seed_fraction` seeds part of the initial population from the exact optimum.
+    `memo_size` and `deduplicate` enable the fitness memo and clone replacement.
+    """
+    evolution = Evolution(pop_size, generations, mutation_rate, elitism, patience, crossover_method, select,
+                          rng, profile, checkpoint_path, checkpoint_every, local_search, local_search_budget, seed_fraction,
+                          memo_size, deduplicate)
+    for _ in evolution:
+        pass
+
+    # Return the best solution
+    return evolution.best().genes, evolution.avg_fitness_progress
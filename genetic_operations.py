@@ -1,36 +1,101 @@
 import numpy as np
-import random
-from helpers import repair_balance
-from parameters import affinity_matrix, n, m
+from helpers import repair_balance, repair_balance_batch, population_counts, row_blocks
+from chromosome import Chromosome, _fitness
+from problem import get_problem
+from profiling import count
+from fitness_cache import memoized, memoized_batch
+
+def _population_fitness(population):
+    count("fitness_evaluations", len(population))
+    problem = get_problem()
+    # Gathered in blocks of rows, so the affinities in flight stay small
+    scores = np.empty(len(population))
+    for rows in row_blocks(*population.shape):
+        scores[rows] = problem.affinity(problem.students, population[rows]).sum(axis=1)
+    return scores
 
 def fitness(chromosome):
-    return np.sum(affinity_matrix * chromosome)
-
-def mutate(chromosome, mutation_rate=0.1):
-    if random.random() < mutation_rate:
-        student = random.randint(0, n - 1)
-        current_groups = np.where(chromosome[student] == 1)[0]
-        if current_groups.size == 0:
-            valid_groups = np.where(affinity_matrix[student] > 0)[0]
-            new_group = random.choice(valid_groups)
-            chromosome[student, new_group] = 1
-        else:
-            current_group = current_groups[0]
-            valid_groups = [g for g in range(m) if g != current_group and affinity_matrix[student, g] > 0]
-            if valid_groups:
-                new_group = random.choice(valid_groups)
-                chromosome[student, current_group] = 0
-                chromosome[student, new_group] = 1
-    return repair_balance(chromosome)
-
-def tournament_selection(population, fitness_scores, k=3):
-    candidates = random.sample(list(zip(population, fitness_scores)), k)
-    return max(candidates, key=lambda x: x[1])[0]
-
-def roulette_wheel_selection(population, fitness_scores):
+    return memoized(chromosome, _fitness)
+
+def population_fitness(population):
+    """Score a whole population (list or stacked array of chromosomes) with a single gather."""
+    return memoized_batch(np.asarray(population), _population_fitness)
+
+def mutate(chromosome, mutation_rate=0.1, rng=None):
+    if not isinstance(chromosome, Chromosome):
+        return mutate(Chromosome(chromosome), mutation_rate, rng).genes
+
+    count("mutate_calls")
+    rng = np.random.default_rng(rng)
+    pinned = None
+    if rng.random() < mutation_rate:
+        problem = get_problem()
+        student = rng.integers(problem.n)
+        current_group = chromosome.genes[student]
+        indptr, option_groups, _ = problem.options
+        valid_groups = option_groups[indptr[student]:indptr[student + 1]]
+        valid_groups = valid_groups[valid_groups != current_group]
+        if valid_groups.size:
+            chromosome.move(student, rng.choice(valid_groups))
+            # Repair must not simply send the mutated student back
+            pinned = [student]
+    return repair_balance(chromosome, pinned)
+
+def mutate_batch(population, mutation_rate=0.1, counts=None, scores=None, rng=None):
+    """
+    Mutate a (k, n) stack of gene vectors in place, as mutate does one chromosome,
+    with the coin flips, students and new groups of all k drawn in bulk. The whole
+    stack is then repaired in one call, which leaves the mutated students in their
+    new groups; `counts` and `scores` are kept up to date as in repair_balance_batch.
+    """
+    count("mutate_calls", len(population))
+    rng = np.random.default_rng(rng)
+    problem = get_problem()
+    mutating = rng.random(len(population)) < mutation_rate
+    students = rng.integers(problem.n, size=len(population))
+    picks = rng.random(len(population))
+
+    rows = np.nonzero(mutating)[0]
+    if counts is None:
+        counts = population_counts(population)
+    moved = move_to_other_option(population, rows, students[rows], picks[rows], counts, scores)
+    return repair_balance_batch(population, counts, scores, pinned=moved)
+
+def move_to_other_option(population, rows, students, picks, counts, scores=None):
+    """
+    Move every (row, student) of a stack to one of its student's other valid groups, the
+    one at fraction `picks` through them, updating `counts` and `scores` in place.
+    Students with no other valid group stay where they are. Returns the rows and
+    students that moved.
+    """
+    problem = get_problem()
+    option_groups = problem.options[1]
+    current = population[rows, students]
+    # Every other valid group of each moving student, then a uniform pick among them
+    owners, positions = problem.option_positions(students)
+    other = option_groups[positions] != current[owners]
+    owners, positions = owners[other], positions[other]
+    choices = np.bincount(owners, minlength=len(rows))
+    movable = choices > 0
+    first = np.cumsum(choices) - choices
+    groups = option_groups[positions[first[movable] + (picks[movable] * choices[movable]).astype(np.intp)]]
+    rows, students, current = rows[movable], students[movable], current[movable]
+
+    if scores is not None:
+        np.add.at(scores, rows, problem.affinity(students, groups) - problem.affinity(students, current))
+    np.subtract.at(counts, (rows, current), 1)
+    np.add.at(counts, (rows, groups), 1)
+    population[rows, students] = groups
+    return rows, students
+
+def tournament_selection(population, fitness_scores, k=3, rng=None):
+    candidates = np.random.default_rng(rng).choice(len(population), k, replace=False)
+    return population[max(candidates, key=lambda i: fitness_scores[i])]
+
+def roulette_wheel_selection(population, fitness_scores, rng=None):
     total_fitness = sum(fitness_scores)
     
-    pick = random.uniform(0, total_fitness)
+    pick = np.random.default_rng(rng).uniform(0, total_fitness)
     
     current = 0
     for individual, fitness in zip(population, fitness_scores):
@@ -38,7 +103,7 @@ def roulette_wheel_selection(population, fitness_scores):
         if current > pick:
             return individual
 
-def stochastic_universal_sampling(population, fitness_scores, num_to_select=1):
+def stochastic_universal_sampling(population, fitness_scores, num_to_select=1, rng=None):
     # Calculate the total fitness
     total_fitness = sum(fitness_scores)
     
@@ -46,7 +111,7 @@ def stochastic_universal_sampling(population, fitness_scores, num_to_select=1):
     pointer_spacing = total_fitness / num_to_select
     
     # Generate a random start point
-    start_point = random.uniform(0, pointer_spacing)
+    start_point = np.random.default_rng(rng).uniform(0, pointer_spacing)
     
     # Generate the pointers
     pointers = [start_point + i * pointer_spacing for i in range(num_to_select)]
@@ -62,3 +127,44 @@ def stochastic_universal_sampling(population, fitness_scores, num_to_select=1):
     
     # Return the selected individual(s)
     return selected_individuals if num_to_select > 1 else selected_individuals[0]
+
+# Batch mode: every parent of a generation is picked in one call, returned as indices
+
+def tournament_selection_batch(fitness_scores, num_to_select, k=3, rng=None):
+    # One row of k distinct contestants per tournament, drawn column by column (Floyd's algorithm).
+    # The columns of 2-D scores are independent populations, each getting its own tournaments.
+    rng = np.random.default_rng(rng)
+    fitness_scores = np.asarray(fitness_scores)
+    size = len(fitness_scores)
+    draws = rng.random((k, num_to_select) + fitness_scores.shape[1:])
+    candidates = np.empty(draws.shape[1:] + (k,), dtype=np.intp)
+    for column, upper in enumerate(range(size - k, size)):
+        pick = (draws[column] * (upper + 1)).astype(np.intp)
+        taken = np.any(candidates[..., :column] == pick[..., None], axis=-1)
+        candidates[..., column] = np.where(taken, upper, pick)
+    if fitness_scores.ndim == 1:
+        contests = fitness_scores[candidates]
+    else:
+        contests = fitness_scores[candidates, np.arange(fitness_scores.shape[1])[:, None]]
+    winners = np.argmax(contests, axis=-1)
+    return np.take_along_axis(candidates, winners[..., None], axis=-1)[..., 0]
+
+def roulette_wheel_selection_batch(fitness_scores, num_to_select, rng=None):
+    cumulative = np.cumsum(fitness_scores)
+    picks = np.random.default_rng(rng).uniform(0, cumulative[-1], num_to_select)
+    return np.minimum(np.searchsorted(cumulative, picks, side='right'), len(cumulative) - 1)
+
+def stochastic_universal_sampling_batch(fitness_scores, num_to_select, rng=None):
+    rng = np.random.default_rng(rng)
+    cumulative = np.cumsum(fitness_scores)
+    pointer_spacing = cumulative[-1] / num_to_select
+    pointers = rng.uniform(0, pointer_spacing) + pointer_spacing * np.arange(num_to_select)
+    selected = np.minimum(np.searchsorted(cumulative, pointers), len(cumulative) - 1)
+    # Pointers come out in population order; shuffle so consecutive picks make varied pairs
+    return rng.permutation(selected)
+
+batch_selection_methods = {
+    tournament_selection: tournament_selection_batch,
+    roulette_wheel_selection: roulette_wheel_selection_batch,
+    stochastic_universal_sampling: stochastic_universal_sampling_batch,
+}
@@ -1,51 +1,273 @@
 import numpy as np
-import random
-from parameters import n, m, group_size, affinity_matrix
-
-def initialize_population(pop_size):
-    population = []
-    for _ in range(pop_size):
-        chromosome = np.zeros((n, m), dtype=int)
-        for student in range(n):
-            valid_groups = np.where(affinity_matrix[student] > 0)[0]
-            group = random.choice(valid_groups)
-            chromosome[student, group] = 1
-        if not is_balanced(chromosome):
-            chromosome = repair_balance(chromosome)
-        population.append(chromosome)
+from problem import get_problem
+from chromosome import Chromosome
+from profiling import phase, count
+
+# Elements per block when array work is split into blocks to bound its temporary memory
+BLOCK_ELEMENTS = 1 << 16
+
+def initialize_population(pop_size, rng=None, seed_fraction=0.0, perturbation=0.1):
+    """
+    A (pop_size, n) stack of random balanced chromosomes.
+
+    With a `seed_fraction`, that share of the population instead starts from the exact
+    optimum (problem.optimum): the first one is the optimum itself and the others are
+    copies where about a `perturbation` share of the students swapped groups at random.
+    """
+    rng = np.random.default_rng(rng)
+    problem = get_problem()
+    population = random_valid_groups((pop_size, problem.n), rng)
+    repair_balance_batch(population)
+
+    num_seeded = min(pop_size, int(round(seed_fraction * pop_size)))
+    if num_seeded:
+        seeded = np.tile(problem.optimum, (num_seeded, 1))
+        rows = np.arange(1, num_seeded)
+        for _ in range(max(1, int(perturbation * problem.n / 2))):
+            # Swaps keep every group at its size; those into a zero-affinity group are skipped
+            first, second = rng.integers(problem.n, size=(2, len(rows)))
+            group1, group2 = seeded[rows, first], seeded[rows, second]
+            valid = (problem.affinity(first, group2) > 0) & (problem.affinity(second, group1) > 0)
+            seeded[rows[valid], first[valid]] = group2[valid]
+            seeded[rows[valid], second[valid]] = group1[valid]
+        population[:num_seeded] = seeded
     return population
 
+def random_valid_groups(shape, rng=None):
+    """A uniformly random valid group for every student, in an array of `shape` whose last axis is n."""
+    problem = get_problem()
+    indptr, option_groups, _ = problem.options
+    lengths = np.diff(indptr)
+    picks = indptr[:-1] + (np.random.default_rng(rng).random(shape) * lengths).astype(np.intp)
+    return option_groups[picks].astype(problem.gene_dtype)
+
+def to_one_hot(chromosome):
+    """Convert group-index chromosome(s) to the n x m one-hot form."""
+    return np.eye(get_problem().m, dtype=int)[chromosome]
+
+def from_one_hot(one_hot):
+    """Convert one-hot chromosome(s) back to group-index form."""
+    return np.argmax(one_hot, axis=-1).astype(get_problem().gene_dtype)
+
 def is_balanced(chromosome):
-    return all(np.sum(chromosome, axis=0) == group_size)
-
-def repair_balance(chromosome):
-    group_counts = np.sum(chromosome, axis=0)
-    excess = np.where(group_counts > group_size)[0]
-    deficit = np.where(group_counts < group_size)[0]
-
-    for e in excess:
-        students = np.where(chromosome[:, e] == 1)[0]
-        for s in students:
-            if group_counts[e] == group_size:
-                break
-            valid_groups = [g for g in range(m) if g != e and group_counts[g] < group_size and affinity_matrix[s, g] > 0]
-            if valid_groups:
-                new_group = random.choice(valid_groups)
-                chromosome[s, e] = 0
-                chromosome[s, new_group] = 1
-                group_counts[e] -= 1
-                group_counts[new_group] += 1
-
-    for student in range(n):
-        if not np.any(chromosome[student]):
-            valid_groups = np.where(affinity_matrix[student] > 0)[0]
-            if valid_groups.size > 0:
-                new_group = random.choice(valid_groups)
-                chromosome[student, new_group] = 1
-                group_counts[new_group] += 1
+    problem = get_problem()
+    if isinstance(chromosome, Chromosome):
+        return all(chromosome.counts == problem.group_size)
+    return all(np.bincount(chromosome, minlength=problem.m) == problem.group_size)
+
+def row_blocks(k, n):
+    """Slices splitting k rows of n elements into blocks of about BLOCK_ELEMENTS elements."""
+    step = max(1, BLOCK_ELEMENTS // max(n, 1))
+    return [slice(start, start + step) for start in range(0, k, step)]
+
+def population_counts(population, out=None):
+    """Group counts of every chromosome in a (k, n) stack, as a (k, m) array (`out` if given)."""
+    m = get_problem().m
+    if out is None:
+        out = np.empty((len(population), m), dtype=np.intp)
+    for rows in row_blocks(*population.shape):
+        block = population[rows]
+        offsets = m * np.arange(len(block))[:, None]
+        out[rows] = np.bincount((block + offsets).ravel(), minlength=len(block) * m).reshape(-1, m)
+    return out
+
+def _rank_within(keys):
+    """Position of every element among the elements sharing its (sorted) key."""
+    return np.arange(len(keys)) - np.searchsorted(keys, keys)
+
+def plan_repair(population, counts, pinned=None):
+    """
+    Work out the moves that balance a stack of chromosomes.
+
+    Over-full groups give up their lowest-affinity students, and every student that
+    leaves goes to the under-full group of its chromosome it has the highest affinity
+    for. Each step is a handful of array operations over all chromosomes at once.
+    A student with no open valid group stays, and the next one of its group is tried
+    instead; chromosomes that still cannot be balanced that way are finished with
+    chains of moves through full groups (see _augment).
+
+    Args:
+        population: (k, n) array of gene vectors.
+        counts: (k, m) array with their group counts.
+        pinned: Optional (rows, students) that are not evicted, such as the students a
+            mutation just moved, which would otherwise often be the ones sent back.
+
+    Returns:
+        Chromosome row, student and new group of every move; no student moves twice.
 
+    Raises:
+        ValueError: if a chromosome has no balanced assignment within its students' valid groups.
+    """
+    problem = get_problem()
+    m = problem.m
+    excess = counts - problem.group_size
+    if not np.any(excess > 0):
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty
+
+    # Candidates to leave: students in over-full groups, ordered by (chromosome, group, affinity)
+    rows, students = np.nonzero(np.take_along_axis(excess > 0, population, axis=1))
+    if pinned is not None:
+        pinned_rows, pinned_students = np.asarray(pinned[0]), np.asarray(pinned[1])
+        keep = ~np.isin(rows * problem.n + students, pinned_rows * problem.n + pinned_students)
+        rows, students = rows[keep], students[keep]
+    sources = population[rows, students]
+    order = np.lexsort((problem.affinity(students, sources), rows * m + sources))
+    rows, students, sources = rows[order], students[order], sources[order]
+
+    # Place the students in rounds: each over-full group offers its lowest-affinity
+    # candidates, each asks for its best open group and every group accepts as many
+    # of its highest-affinity askers as it has room for
+    capacity = np.maximum(-excess, 0)
+    excess = np.maximum(excess, 0)
+    moves = []
+    while rows.size:
+        source_keys = rows * m + sources
+        offered = np.nonzero(_rank_within(source_keys) < excess.reshape(-1)[source_keys])[0]
+        choice, choice_affinity = _best_open_options(problem, rows[offered], students[offered], capacity)
+        placeable = offered[choice >= 0]
+        choice, choice_affinity = choice[choice >= 0], choice_affinity[choice >= 0]
+
+        keys = rows[placeable] * m + choice
+        order = np.lexsort((-choice_affinity, keys))
+        sorted_keys = keys[order]
+        accepted = order[_rank_within(sorted_keys) < capacity.reshape(-1)[sorted_keys]]
+        moving = placeable[accepted]
+        moves.append((rows[moving], students[moving], choice[accepted]))
+        capacity -= np.bincount(keys[accepted], minlength=capacity.size).reshape(capacity.shape)
+        excess -= np.bincount(source_keys[moving], minlength=excess.size).reshape(excess.shape)
+
+        # Capacity only shrinks, so offered students without an open group never get one and
+        # are dropped, as are the movers and the candidates of groups that are no longer
+        # over-full; every round drops at least one candidate
+        staying = np.ones(rows.size, dtype=bool)
+        staying[offered] = False
+        staying[placeable] = True
+        staying[moving] = False
+        staying &= excess.reshape(-1)[source_keys] > 0
+        rows, students, sources = rows[staying], students[staying], sources[staying]
+
+    moves = [np.concatenate(parts) for parts in zip(*moves)] if moves else [np.empty(0, dtype=np.intp)] * 3
+    stuck = np.nonzero(np.any(excess > 0, axis=1))[0]
+    if stuck.size:
+        # Redo the moves of the stuck chromosomes with the chains they need on top
+        parts = [[part[~np.isin(moves[0], stuck)]] for part in moves]
+        for row in stuck:
+            mine = moves[0] == row
+            row_pinned = None if pinned is None else pinned_students[pinned_rows == row]
+            chain_students, chain_groups = _augment(population[row], moves[1][mine], moves[2][mine], excess[row], capacity[row], row_pinned)
+            for part, values in zip(parts, (np.full(len(chain_students), row), chain_students, chain_groups)):
+                part.append(values)
+        moves = [np.concatenate(part) for part in parts]
+    return tuple(moves)
+
+def _best_open_options(problem, rows, students, capacity):
+    # Highest-affinity valid group with room of every (row, student), or -1, and its
+    # affinity; students are taken in blocks so their expanded option lists stay small
+    indptr, option_groups, option_affinities = problem.options
+    choice = np.full(len(students), -1, dtype=np.intp)
+    choice_affinity = np.zeros(len(students))
+    ends = np.cumsum(indptr[students + 1] - indptr[students])
+    start = 0
+    while start < len(students):
+        stop = max(start + 1, np.searchsorted(ends, (ends[start - 1] if start else 0) + BLOCK_ELEMENTS, side="right"))
+        owners, positions = problem.option_positions(students[start:stop])
+        groups = option_groups[positions]
+        open_options = capacity[rows[start:stop][owners], groups] > 0
+        owners, positions, groups = owners[open_options], positions[open_options], groups[open_options]
+        first = np.lexsort((-option_affinities[positions], owners))
+        first = first[np.r_[True, owners[first][1:] != owners[first][:-1]]] if first.size else first
+        choice[start + owners[first]] = groups[first]
+        choice_affinity[start + owners[first]] = option_affinities[positions[first]]
+        start = stop
+    return choice, choice_affinity
+
+def _augment(genes, students, groups, excess, capacity, pinned=None):
+    """
+    Balance one chromosome that greedy placement left stuck, after applying its moves
+    so far (`students` to `groups`). Each step finds a shortest chain from an over-full
+    group to one with room, in which every student moves on to the group the next one
+    left, through a breadth-first search over the groups. `pinned` students only take
+    part in chains when there is no chain without them. Returns the students whose
+    group changed overall, and their new groups.
+    """
+    problem = get_problem()
+    option_groups = problem.options[1]
+    current = genes.copy()
+    current[students] = groups
+    excess, capacity = excess.copy(), capacity.copy()
+    # Every (student, valid group) pair is a possible step from the student's group to that group
+    owners, positions = problem.option_positions(problem.students)
+    targets = option_groups[positions]
+    free = np.ones(len(owners), dtype=bool) if pinned is None else ~np.isin(owners, pinned)
+    while np.any(excess > 0):
+        sources = current[owners]
+        steps = (sources != targets) & free
+        step_students, step_sources, step_targets = owners[steps], sources[steps], targets[steps]
+        parent = np.full(problem.m, -1)
+        reached = excess > 0
+        frontier = reached.copy()
+        end = None
+        while end is None and np.any(frontier):
+            # First step into every group not reached yet, from the current frontier
+            new = frontier[step_sources] & ~reached[step_targets]
+            found, first = np.unique(step_targets[new], return_index=True)
+            parent[found] = np.nonzero(new)[0][first]
+            reached[found] = True
+            frontier = np.zeros(problem.m, dtype=bool)
+            frontier[found] = True
+            open_found = found[capacity[found] > 0]
+            if open_found.size:
+                end = open_found[0]
+        if end is None and not np.all(free):
+            free[:] = True
+            continue
+        if end is None:
+            raise ValueError("Chromosome cannot be balanced: no valid chain of moves frees an over-full group")
+        capacity[end] -= 1
+        group = end
+        while parent[group] >= 0:
+            step = parent[group]
+            current[step_students[step]] = group
+            group = step_sources[step]
+        excess[group] -= 1
+    changed = np.nonzero(current != genes)[0]
+    return changed, current[changed]
+
+def repair_balance(chromosome, pinned=None):
+    if not isinstance(chromosome, Chromosome):
+        return repair_balance(Chromosome(chromosome), pinned).genes
+
+    count("repair_calls")
+    with phase("repair"):
+        if pinned is not None:
+            pinned = (np.zeros(len(pinned), dtype=np.intp), pinned)
+        _, students, groups = plan_repair(chromosome.genes[None], chromosome.counts[None], pinned)
+        chromosome.move_many(students, groups)
     return chromosome
 
+def repair_balance_batch(population, counts=None, scores=None, pinned=None):
+    """
+    Repair a (k, n) stack of gene vectors in place with a single plan_repair call,
+    which leaves the `pinned` (rows, students) where they are.
+
+    If given, the matching (k, m) group counts and (k,) fitness scores are updated
+    alongside with the same incremental deltas Chromosome.move uses.
+    """
+    count("repair_calls")
+    with phase("repair"):
+        if counts is None:
+            counts = population_counts(population)
+        problem = get_problem()
+        rows, students, groups = plan_repair(population, counts, pinned)
+        old_groups = population[rows, students]
+        if scores is not None:
+            np.add.at(scores, rows, problem.affinity(students, groups) - problem.affinity(students, old_groups))
+        np.subtract.at(counts, (rows, old_groups), 1)
+        np.add.at(counts, (rows, groups), 1)
+        population[rows, students] = groups
+    return population
+
 def align_fitness_progressions(fitness_runs):
     max_length = max(len(run) for run in fitness_runs)  # Find the longest progression
     aligned_runs = []
@@ -56,3 +278,19 @@ def align_fitness_progressions(fitness_runs):
         else:
             aligned_runs.append(run[:max_length])  # Truncate if needed
     return np.array(aligned_runs)
+
+def measure_convergence_speed(results):
+    """Generations each method's mean progress needs to reach 90% of its worst best fitness."""
+    speeds = {}
+    for method_name, method_results in results.items():
+        threshold = 0.9 * min(method_results["best_fitness"])
+        generations_to_converge = []
+
+        for generation_index, fitness_value in enumerate(method_results["avg_fitness_progress"]):
+            if fitness_value >= threshold:
+                generations_to_converge.append(generation_index)
+                break  # Once the threshold is reached, stop checking further generations
+        if generations_to_converge == []:
+            generations_to_converge.append(0)
+        speeds[method_name] = np.mean(generations_to_converge)
+    return speeds
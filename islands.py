@@ -0,0 +1,118 @@
+import multiprocessing
+import numpy as np
+from problem import get_problem, share_problem, attach_problem
+from helpers import initialize_population, population_counts
+from genetic_algorithm import PopulationArena, breed
+from genetic_operations import tournament_selection, population_fitness
+
+def migration_sources(num_islands, topology="ring"):
+    """For every island, the islands it receives migrants from."""
+    if topology == "ring":
+        return [[(island - 1) % num_islands] for island in range(num_islands)]
+    if topology == "full":
+        return [[source for source in range(num_islands) if source != island] for island in range(num_islands)]
+    raise ValueError(f"Unknown migration topology: {topology!r}")
+
+def _island(conn, problem_handle, seed, num_migrants, pop_size, breeding):
+    # Work on the coordinator's instance arrays and derived tables in place, without
+    # copying them or building private tables
+    attach_problem(problem_handle)
+    rng = np.random.default_rng(seed)
+
+    # The island's population lives in one arena for the whole run
+    arena = PopulationArena(pop_size)
+    genes = initialize_population(pop_size, rng)
+    arena.load(genes, population_fitness(genes))
+    while (message := conn.recv()) is not None:
+        generations, immigrants = message
+
+        # Immigrants replace the worst individuals of the island
+        if immigrants:
+            worst = np.argsort(arena.scores)[:len(immigrants)]
+            arena.genes[worst] = immigrants[:len(worst)]
+            arena.counts[worst] = population_counts(arena.genes[worst])
+            arena.scores[worst] = population_fitness(arena.genes[worst])
+
+        avg_fitness_progress = []
+        for _ in range(generations):
+            avg_fitness_progress.append(np.mean(arena.scores))
+            breed(arena, **breeding, rng=rng)
+            arena.swap()
+
+        ranking = np.argsort(arena.scores)[::-1]
+        emigrants = [arena.genes[i] for i in ranking[:num_migrants]]
+        conn.send((avg_fitness_progress, arena.scores[ranking[0]], arena.genes[ranking[0]], emigrants))
+
+def island_model(num_islands=4, migration_interval=10, num_migrants=2, topology="ring", generations=100, patience=10, seed=0,
+                 pop_size=50, mutation_rate=0.1, elitism=1, crossover_method=None, select=tournament_selection):
+    """
+    Run one GA sub-population per worker process, exchanging top individuals between them.
+
+    Every `migration_interval` generations each island sends its `num_migrants` best
+    chromosomes to its neighbours in the ring or fully connected `topology`, where they
+    replace the worst ones. Islands read the instance arrays from shared memory and are
+    seeded with independent streams spawned from `seed`. The run stops after
+    `generations` generations, or once the global best has not improved for at least
+    `patience` generations (checked at every migration).
+
+    Returns:
+        The best chromosome found on any island, and a results dict with the best fitness
+        and average fitness progress of every island, as plot_results expects.
+    """
+    problem = get_problem()
+    sources = migration_sources(num_islands, topology)
+    seeds = np.random.SeedSequence(seed).spawn(num_islands)
+    breeding = dict(mutation_rate=mutation_rate, elitism=elitism, crossover_method=crossover_method, select=select)
+
+    shm, problem_handle = share_problem(problem)
+    try:
+
+        connections, workers = [], []
+        for island in range(num_islands):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_island,
+                args=(worker_conn, problem_handle, seeds[island], num_migrants, pop_size, breeding),
+                daemon=True,
+            )
+            worker.start()
+            connections.append(conn)
+            workers.append(worker)
+
+        avg_fitness_progress = [[] for _ in range(num_islands)]
+        island_best = [float('-inf')] * num_islands
+        best_fitness = float('-inf')
+        best_solution = None
+        immigrants = [[] for _ in range(num_islands)]
+        generation = 0
+        no_improvement = 0
+        while generation < generations and no_improvement < patience:
+            epoch = min(migration_interval, generations - generation)
+            for conn, arriving in zip(connections, immigrants):
+                conn.send((epoch, arriving))
+            replies = [conn.recv() for conn in connections]
+            generation += epoch
+
+            no_improvement += epoch
+            for island, (progress, island_fitness, island_solution, _) in enumerate(replies):
+                avg_fitness_progress[island].extend(progress)
+                island_best[island] = max(island_best[island], island_fitness)
+                if island_fitness > best_fitness:
+                    best_fitness, best_solution = island_fitness, island_solution
+                    no_improvement = 0
+
+            immigrants = [[genes for source in sources[island] for genes in replies[source][3]] for island in range(num_islands)]
+
+        for conn in connections:
+            conn.send(None)
+        for worker in workers:
+            worker.join()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = {
+        f"Island {island + 1}": {"best_fitness": [island_best[island]], "avg_fitness_progress": np.array(avg_fitness_progress[island])}
+        for island in range(num_islands)
+    }
+    return best_solution, results
@@ -0,0 +1,90 @@
+import time
+import numpy as np
+from problem import get_problem
+from profiling import count
+
+# Upper bound on the number of gains held in memory at once
+_CHUNK_ELEMENTS = 1 << 22
+
+def fold_moves(problem, genes, rows, students, best_gain, best_student):
+    """
+    Fold every valid move of the given (row, student) pairs into best_gain[row, a, b],
+    the largest d[i, b] = A[i, b] - A[i, a] over the members i of group a, and record
+    the student achieving it in best_student. Only positive-affinity groups are
+    options, so moves built from these never break validity.
+    """
+    m = problem.m
+    indptr, option_groups, option_affinities = problem.options
+    groups = genes[rows, students]
+    lengths = indptr[students + 1] - indptr[students]
+    positions = problem.option_positions(students)[1]
+    # Per-student terms, spread over the student's options
+    targets = option_groups[positions]
+    gains = option_affinities[positions] - np.repeat(problem.affinity(students, groups), lengths)
+    keys = np.repeat((rows * m + groups) * m, lengths) + targets
+    moving = targets != np.repeat(groups, lengths)
+    keys, gains, students = keys[moving], gains[moving], np.repeat(students, lengths)[moving]
+
+    flat_gain = best_gain.reshape(-1)
+    np.maximum.at(flat_gain, keys, gains)
+    is_best = gains == flat_gain[keys]
+    best_student.reshape(-1)[keys[is_best]] = students[is_best]
+
+def _search_block(genes, scores, deadline, max_rounds):
+    problem = get_problem()
+    k, n, m = len(genes), problem.n, problem.m
+    best_gain = np.full((k, m, m), -np.inf)
+    best_student = np.zeros((k, m, m), dtype=np.intp)
+    fold_moves(problem, genes, np.repeat(np.arange(k), n), np.tile(problem.students, k), best_gain, best_student)
+
+    rounds = 0
+    while max_rounds is None or rounds < max_rounds:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        # The best swap between groups a and b gains M[a, b] + M[b, a]; every group is paired
+        # with the partner of its best swap, and mutually best pairs are disjoint
+        pair_gain = best_gain + best_gain.transpose(0, 2, 1)
+        partner = np.argmax(pair_gain, axis=2)
+        rows, groups1 = np.nonzero(np.arange(m) < partner)
+        groups2 = partner[rows, groups1]
+        gains = pair_gain[rows, groups1, groups2]
+        improving = (partner[rows, groups2] == groups1) & (gains > 1e-9)
+        if not np.any(improving):
+            break
+        rows, groups1, groups2, gains = rows[improving], groups1[improving], groups2[improving], gains[improving]
+
+        genes[rows, best_student[rows, groups1, groups2]] = groups2
+        genes[rows, best_student[rows, groups2, groups1]] = groups1
+        if scores is not None:
+            np.add.at(scores, rows, gains)
+        count("local_search_swaps", len(rows))
+
+        # Only the swapped groups changed members, so only their rows of M are recomputed
+        touched = np.zeros((k, m), dtype=bool)
+        touched[rows, groups1] = touched[rows, groups2] = True
+        best_gain[touched] = -np.inf
+        fold_moves(problem, genes, *np.nonzero(np.take_along_axis(touched, genes, axis=1)), best_gain, best_student)
+        rounds += 1
+
+def swap_local_search(population, scores=None, time_budget=None, max_rounds=None):
+    """
+    Improve a (k, n) stack of gene vectors in place with swaps of two students
+    between groups, which keep every group at its size.
+
+    Moving student i from its group to group b changes the fitness by
+    d[i, b] = A[i, b] - A[i, g_i], so the best swap between groups a and b gains
+    M[a, b] + M[b, a], where M[a, b] is the largest d[i, b] over the members of a.
+    Each round applies the best disjoint swaps of every chromosome, until no swap
+    improves any of them, `max_rounds` rounds have run or `time_budget` seconds have
+    passed. If given, the (k,) fitness `scores` are updated with the gains.
+    """
+    problem = get_problem()
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    # Chromosomes are searched in blocks to bound the memory of the gain tables
+    per_chromosome = max(len(problem.options[1]), problem.m * problem.m)
+    block_size = max(1, _CHUNK_ELEMENTS // per_chromosome)
+    for start in range(0, len(population), block_size):
+        block = slice(start, start + block_size)
+        genes = population[block]
+        _search_block(genes, None if scores is None else scores[block], deadline, max_rounds)
+    return population
@@ -0,0 +1,200 @@
+import numpy as np
+from problem import SparseProblem, use_problem
+from helpers import initialize_population, population_counts, repair_balance_batch
+from genetic_operations import tournament_selection_batch, move_to_other_option
+from crossover_methods import uniform_crossover, bernouilli_crossover, single_point_crossover, two_point_crossover
+
+class JoinedProblem(SparseProblem):
+    """
+    A SparseProblem made of independent blocks, each student's options lying in the
+    groups of its own block, which starts at group block_starts[s]. Affinities are
+    looked up in a dense (n, width) table of block-local groups instead of searched for.
+    """
+
+    def __init__(self, indptr, indices, data, m, group_size, block_starts, width):
+        super().__init__(indptr, indices, data, m, group_size)
+        self.block_starts = block_starts
+        # The extra last column stays zero, for groups outside the student's block
+        self._table = np.zeros((self.n, width + 1))
+        students = np.repeat(np.arange(self.n), np.diff(self.indptr))
+        self._table[students, self.indices - block_starts[students]] = self.data
+
+    def affinity(self, students, groups):
+        local = groups - self.block_starts[students]
+        return self._table[students, np.clip(local, -1, self._table.shape[1] - 1)]
+
+class InstanceBucket:
+    """
+    Instances with the same group size joined into one block-diagonal JoinedProblem.
+
+    Instance k owns students starts[k]:starts[k] + sizes[k] and groups
+    group_starts[k]:group_starts[k] + ms[k] of the joined problem. Its students only
+    have options in its own groups, so a joined chromosome is one assignment per
+    instance side by side, and counting, repair and scoring treat every block on its own.
+    """
+
+    def __init__(self, problems):
+        self.problems = problems
+        self.sizes = np.array([problem.n for problem in problems])
+        self.starts = np.cumsum(self.sizes) - self.sizes
+        ms = np.array([problem.m for problem in problems])
+        self.group_starts = np.cumsum(ms) - ms
+        options = [problem.options for problem in problems]
+        indptr = np.concatenate(([0], np.cumsum(np.concatenate([np.diff(option_indptr) for option_indptr, _, _ in options]))))
+        groups = np.concatenate([option_groups.astype(np.int64) + group_start for (_, option_groups, _), group_start in zip(options, self.group_starts)])
+        affinities = np.concatenate([option_affinities for _, _, option_affinities in options])
+        # Instance and position within it of every student of the joined problem
+        self.block = np.repeat(np.arange(len(problems)), self.sizes)
+        self.problem = JoinedProblem(indptr, groups, affinities, ms.sum(), problems[0].group_size, self.group_starts[self.block], ms.max())
+        self.local = np.arange(self.problem.n) - self.starts[self.block]
+
+    def scores(self, population):
+        """(k, instances) fitness of every instance's assignment in a (k, N) stack of joined chromosomes."""
+        return np.add.reduceat(self.problem.affinity(self.problem.students, population), self.starts, axis=1)
+
+    def split(self, genes):
+        """The assignment of every instance in one joined chromosome, in its own group numbering."""
+        return [(genes[start:start + problem.n] - group_start).astype(problem.gene_dtype)
+                for problem, start, group_start in zip(self.problems, self.starts, self.group_starts)]
+
+# Crossover masks over joined chromosomes: True where the first child takes the first
+# parent's gene. Points and probabilities are drawn per instance, so every block is
+# crossed over as the batch crossover would cross that instance alone.
+
+def _uniform_mask(bucket, fitness1, fitness2, rng):
+    return rng.random((len(fitness1), bucket.problem.n)) < 0.5
+
+def _bernouilli_mask(bucket, fitness1, fitness2, rng):
+    total_fitness = fitness1 + fitness2
+    prob_parent1 = np.divide(fitness1, total_fitness, out=np.full(fitness1.shape, 0.5), where=total_fitness != 0)
+    return rng.random((len(fitness1), bucket.problem.n)) < prob_parent1[:, bucket.block]
+
+def _single_point_mask(bucket, fitness1, fitness2, rng):
+    points = rng.integers(1, bucket.sizes, size=fitness1.shape)
+    return bucket.local < points[:, bucket.block]
+
+def _two_point_mask(bucket, fitness1, fitness2, rng):
+    point1 = rng.integers(bucket.sizes, size=fitness1.shape)
+    point2 = rng.integers(bucket.sizes - 1, size=fitness1.shape)
+    point2 += point2 >= point1
+    point1, point2 = np.minimum(point1, point2)[:, bucket.block], np.maximum(point1, point2)[:, bucket.block]
+    return (bucket.local < point1) | (bucket.local >= point2)
+
+instance_masks = {
+    uniform_crossover: _uniform_mask,
+    bernouilli_crossover: _bernouilli_mask,
+    single_point_crossover: _single_point_mask,
+    two_point_crossover: _two_point_mask,
+}
+
+def _breed(bucket, population, scores, pop_size, mutation_rate, elitism, make_mask, rng):
+    # Selection, elitism and mutation work per instance; repair runs once over the joined stack
+    columns = np.arange(bucket.problem.n)
+    elitism = min(elitism, pop_size)
+    if elitism:
+        elite_indices = np.argpartition(scores, pop_size - elitism, axis=0)[pop_size - elitism:]
+    else:
+        elite_indices = np.empty((0, len(bucket.problems)), dtype=np.intp)
+    elites = population[elite_indices[:, bucket.block], columns]
+
+    num_pairs = -(-(pop_size - elitism) // 2)
+    parents = tournament_selection_batch(scores, 2 * num_pairs, rng=rng)
+    first, second = parents[0::2], parents[1::2]
+    parents1, parents2 = population[first[:, bucket.block], columns], population[second[:, bucket.block], columns]
+    instances = np.arange(len(bucket.problems))
+    mask = make_mask(bucket, scores[first, instances], scores[second, instances], rng)
+    # Interleave the children as the per-pair loop would
+    children = np.stack((np.where(mask, parents1, parents2), np.where(mask, parents2, parents1)), axis=1)
+    children = repair_balance_batch(children.reshape(-1, bucket.problem.n)[:pop_size - elitism])
+
+    # Every instance of every child flips its own mutation coin
+    counts = population_counts(children)
+    mutating = rng.random((len(children), len(bucket.problems))) < mutation_rate
+    students = bucket.starts + (rng.random(mutating.shape) * bucket.sizes).astype(np.intp)
+    picks = rng.random(mutating.shape)
+    rows, blocks = np.nonzero(mutating)
+    moved = move_to_other_option(children, rows, students[rows, blocks], picks[rows, blocks], counts)
+    repair_balance_batch(children, counts, pinned=moved)
+    return np.concatenate((elites, children))
+
+def _solve_bucket(bucket, pop_size, generations, mutation_rate, elitism, patience, make_mask, rng):
+    instances = len(bucket.problems)
+    with use_problem(bucket.problem):
+        population = initialize_population(pop_size, rng)
+        best_fitness = np.full(instances, -np.inf)
+        best_genes = population[0].copy()
+        no_improvement = np.zeros(instances, dtype=np.intp)
+        active = np.ones(instances, dtype=bool)
+        avg_fitness_progress = [[] for _ in range(instances)]
+        for _ in range(generations):
+            scores = bucket.scores(population)
+            for k in np.nonzero(active)[0]:
+                avg_fitness_progress[k].append(np.mean(scores[:, k]))
+
+            # Instances keep the best assignment they reached while they were running
+            best = np.argmax(scores, axis=0)
+            improved = active & (scores[best, np.arange(instances)] > best_fitness)
+            best_fitness[improved] = scores[best, np.arange(instances)][improved]
+            take = improved[bucket.block]
+            best_genes[take] = population[best[bucket.block], np.arange(bucket.problem.n)][take]
+            no_improvement = np.where(improved, 0, no_improvement + 1)
+
+            # Early stopping per instance; the bucket stops once every instance has
+            active &= no_improvement < patience
+            if not np.any(active):
+                break
+            population = _breed(bucket, population, scores, pop_size, mutation_rate, elitism, make_mask, rng)
+    return bucket.split(best_genes), avg_fitness_progress
+
+def solve_instances(problems, pop_size=50, generations=100, mutation_rate=0.1, elitism=1, patience=10,
+                    crossover_method=uniform_crossover, rng=None, bucket_students=1000):
+    """
+    Run the GA on many independent instances at once, in this process.
+
+    Instances with the same group size are bucketed into joined problems of about
+    `bucket_students` students (see InstanceBucket), whose populations hold every
+    instance's assignments side by side. Fitness, tournament selection, crossover,
+    mutation and repair then run as a few array operations per generation for the
+    whole bucket rather than per instance, which pays off for small instances.
+    Each instance is selected, mutated and stopped early on its own, as its own
+    genetic_algorithm run with tournament selection would be, but all of them draw
+    from the one generator `rng`, so results depend on the batch they are solved in.
+
+    Args:
+        problems: Problem or SparseProblem instances of any sizes.
+        crossover_method: One of the crossovers in instance_masks.
+
+    Returns:
+        The best assignment and average fitness per generation of every instance, in order.
+    """
+    rng = np.random.default_rng(rng)
+    make_mask = instance_masks.get(crossover_method)
+    if make_mask is None:
+        raise ValueError(f"No multi-instance form of {getattr(crossover_method, '__name__', crossover_method)}")
+    for problem in problems:
+        if problem.n != problem.m * problem.group_size:
+            raise ValueError(f"{problem.n} students cannot fill {problem.m} groups of {problem.group_size}")
+
+    # Split every group size's instances into buckets; joined arrays much larger than
+    # bucket_students students no longer fit in cache and gain nothing from batching
+    groups = {}
+    for index, problem in enumerate(problems):
+        groups.setdefault(problem.group_size, []).append(index)
+    buckets = []
+    for indices in groups.values():
+        bucket, students = [], 0
+        for index in indices:
+            if bucket and students + problems[index].n > bucket_students:
+                buckets.append(bucket)
+                bucket, students = [], 0
+            bucket.append(index)
+            students += problems[index].n
+        buckets.append(bucket)
+
+    results = [None] * len(problems)
+    for indices in buckets:
+        bucket = InstanceBucket([problems[index] for index in indices])
+        best, progress = _solve_bucket(bucket, pop_size, generations, mutation_rate, elitism, patience, make_mask, rng)
+        for index, genes, avg_fitness_progress in zip(indices, best, progress):
+            results[index] = (genes, avg_fitness_progress)
+    return results
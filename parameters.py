@@ -1,13 +1,17 @@
-import numpy as np
+from problem import get_problem
 
-# Parameters
-n = 20  # Number of students
-m = 4   # Number of groups
-group_size = n // m  # Students per group
-affinity_matrix = np.random.uniform(0, 5, (n, m))  # Affinity values
+# Problem instance, built on first use: an affinity matrix file (.npy, or raw float64
+# with `groups` columns) opened as a memory map, or a random students x groups instance
+instance_path = None
+students = 20  # Number of students (random instance)
+groups = 4     # Number of groups
+instance_seed = 0
 
-# Ensure no 0-affinity groups for random initialization
-affinity_matrix[affinity_matrix < 1] = 0.1
+def __getattr__(name):
+    # n, m, group_size and affinity_matrix come from the instance, loaded only when asked for
+    if name in ("n", "m", "group_size", "affinity_matrix"):
+        return getattr(get_problem(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Parameters
 pop_size = 300
@@ -16,5 +20,8 @@ mutation_rate = 0.5
 elitism = 40
 trials = 3  # Number of runs per operator
 patience = 20
+racing = False  # Successive halving: only the finalists get the full generations x trials budget
+results_dir = "results"  # Finished runs are stored here and not run again; None disables the store
+plot_dir = None  # Figures are saved here instead of shown, for headless servers
 
-crossover_methods = {}
\ No newline at end of file
+crossover_methods = {}
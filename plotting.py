@@ -1,37 +1,89 @@
-import matplotlib.pyplot as plt
+import multiprocessing
+import os
 import numpy as np
 
-def plot_results(results, xasis):
-    # Plotting results
-    plt.figure(figsize=(12, 8))
+# matplotlib is imported by the renderers only, so importing this module (or running the GA) never loads it
 
-    # Best fitness bar plot
-    # plt.subplot(1, 2, 1)
-    avg_best_fitness = {method: np.mean(results[method]["best_fitness"]) for method in results.keys()}
-    std_best_fitness = {method: np.std(results[method]["best_fitness"]) for method in results.keys()}
+def _pyplot(directory):
+    import matplotlib
+    if directory is not None:
+        # Figures are written to files, which needs no display
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def _finish(plt, directory, name):
+    if directory is None:
+        plt.show()
+    else:
+        os.makedirs(directory, exist_ok=True)
+        plt.savefig(os.path.join(directory, f"{name}.png"), dpi=150)
+        plt.close()
+
+def _file_name(title, xasis):
+    return f"{title} {xasis}".lower().replace(" ", "_")
+
+def _dispatch(render, args, background):
+    # Rendering in a child process lets the caller carry on; it is not a daemon, so
+    # the interpreter waits for the figures before exiting
+    if not background:
+        render(*args)
+        return None
+    process = multiprocessing.Process(target=render, args=args)
+    process.start()
+    return process
+
+def summarize(results):
+    """The arrays the plots need from `results`: method names, best fitness mean and std, mean progress."""
     methods = list(results.keys())
-    plt.bar(methods, avg_best_fitness.values(), yerr=std_best_fitness.values(), capsize=5, color='skyblue')
+    return {
+        "methods": methods,
+        "avg_best_fitness": np.array([np.mean(results[method]["best_fitness"]) for method in methods]),
+        "std_best_fitness": np.array([np.std(results[method]["best_fitness"]) for method in methods]),
+        "avg_fitness_progress": [np.asarray(results[method]["avg_fitness_progress"]) for method in methods],
+    }
+
+def _render_results(summary, xasis, directory):
+    plt = _pyplot(directory)
+    # Best fitness bar plot
+    plt.figure(figsize=(12, 8))
+    plt.bar(summary["methods"], summary["avg_best_fitness"], yerr=summary["std_best_fitness"], capsize=5, color='skyblue')
     plt.xlabel(xasis)
     plt.ylabel("Best Fitness (Mean ± Std)")
     plt.title("Comparison of Best Fitness")
-    plt.show()
+    _finish(plt, directory, _file_name("best fitness", xasis))
 
     # Average fitness progress
-    # plt.subplot(1, 2, 2)
-    for method, data in results.items():
-        plt.plot(data["avg_fitness_progress"], label=method)
+    plt.figure(figsize=(12, 8))
+    for method, progress in zip(summary["methods"], summary["avg_fitness_progress"]):
+        plt.plot(progress, label=method)
     plt.xlabel("Generation")
     plt.ylabel("Average Fitness")
     plt.title("Fitness Progression Over Generations")
     plt.legend()
-
     plt.tight_layout()
-    plt.show()
+    _finish(plt, directory, _file_name("fitness progression", xasis))
 
-def plot_convergence_speed(convergence_speed):
+def _render_convergence_speed(methods, speeds, xasis, directory):
+    plt = _pyplot(directory)
     plt.figure(figsize=(12, 6))
-    plt.bar(convergence_speed.keys(), convergence_speed.values(), color='lightgreen')
-    plt.xlabel('Crossover Methods')
+    plt.bar(methods, speeds, color='lightgreen')
+    plt.xlabel(xasis)
     plt.ylabel('Generations to Converge')
-    plt.title('Convergence Speed of Crossover Methods')
-    plt.show()
+    plt.title(f'Convergence Speed of {xasis}')
+    _finish(plt, directory, _file_name("convergence speed", xasis))
+
+def plot_results(results, xasis, directory=None, background=False):
+    """
+    Bar plot of each method's best fitness and line plot of its mean progress.
+
+    Figures are shown, or saved as PNG files to `directory` without needing a display.
+    With `background` they are rendered by a child process, which is returned; only
+    the summarized arrays are sent to it.
+    """
+    return _dispatch(_render_results, (summarize(results), xasis, directory), background)
+
+def plot_convergence_speed(convergence_speed, xasis="Crossover Methods", directory=None, background=False):
+    """Bar plot of the generations each method needs to converge; see plot_results for the options."""
+    args = (list(convergence_speed.keys()), np.array(list(convergence_speed.values())), xasis, directory)
+    return _dispatch(_render_convergence_speed, args, background)
@@ -0,0 +1,318 @@
+import hashlib
+from contextlib import contextmanager
+from functools import cached_property
+from multiprocessing import shared_memory
+import numpy as np
+
+class Problem:
+    """
+    A class-scheduling instance: the affinity matrix and the tables derived from it.
+
+    Operators only go through `affinity`, `options`, `best_group` and `rank`, so
+    SparseProblem can stand in for it on instances where most affinities are zero.
+    Derived tables are computed on first use and then shared by every operator.
+    """
+
+    # Derived tables that arrays() exports and the constructor adopts ready-made, so
+    # processes sharing an instance's arrays also share these instead of each building its own
+    derived_tables = ("option_indptr", "option_groups", "option_affinities", "best_group", "affinity_rank")
+
+    def __init__(self, affinity_matrix, group_size=None, path=None, **tables):
+        self.affinity_matrix = affinity_matrix
+        self.path = path  # Source file of memory-mapped instances
+        self._setup(*affinity_matrix.shape, group_size)
+        self._adopt(tables)
+
+    def _setup(self, n, m, group_size):
+        self.n, self.m = n, m
+        self.group_size = self.n // self.m if group_size is None else group_size
+        # Chromosomes store one group id per student instead of an n x m one-hot matrix
+        self.gene_dtype = np.int16 if self.m <= np.iinfo(np.int16).max else np.int32
+        self.students = np.arange(self.n)
+
+    def __reduce__(self):
+        # File-backed instances travel between processes as their path, so every
+        # process maps the same file instead of receiving a copy of the matrix
+        if self.path is not None:
+            return load_problem, (self.path, self.m, self.affinity_matrix.dtype, self.group_size, False)
+        return Problem, (np.asarray(self.affinity_matrix), self.group_size)
+
+    def _adopt(self, tables):
+        # Precomputed tables fill the cached properties they stand for
+        if "option_indptr" in tables:
+            self.__dict__["options"] = tuple(tables.pop(name) for name in ("option_indptr", "option_groups", "option_affinities"))
+        self.__dict__.update(tables)
+
+    def tables(self):
+        """Every derived table by constructor argument name, built now if it was not yet."""
+        indptr, option_groups, option_affinities = self.options
+        tables = {"option_indptr": indptr, "option_groups": option_groups, "option_affinities": option_affinities}
+        return dict(tables, **{name: getattr(self, name) for name in self.derived_tables if name not in tables})
+
+    def arrays(self):
+        """
+        The arrays defining the instance and its derived tables, and the other arguments
+        needed to rebuild it with type(self)(**arrays, **arguments).
+        """
+        return dict({"affinity_matrix": self.affinity_matrix}, **self.tables()), {"group_size": self.group_size}
+
+    def affinity(self, students, groups):
+        """Affinity of each student for the matching group (broadcasting like indexing)."""
+        return self.affinity_matrix[students, groups]
+
+    @cached_property
+    def options(self):
+        # Groups each student may be assigned to (positive affinity), as CSR arrays:
+        # student s may join option_groups[indptr[s]:indptr[s + 1]]
+        students, groups = np.nonzero(self.affinity_matrix > 0)
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(students, minlength=self.n))))
+        return indptr, groups.astype(self.gene_dtype), self.affinity_matrix[students, groups]
+
+    def option_positions(self, students):
+        """Owner (index into `students`) and position in `options` of every option of `students`."""
+        indptr = self.options[0]
+        starts = indptr[students]
+        lengths = indptr[np.asarray(students) + 1] - starts
+        owners = np.repeat(np.arange(len(starts)), lengths)
+        positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return owners, positions
+
+    @cached_property
+    def best_group(self):
+        # Highest-affinity group of each student
+        return np.argmax(self.affinity_matrix, axis=1).astype(self.gene_dtype)
+
+    @cached_property
+    def affinity_rank(self):
+        # Rank of each student in each group's affinity column, as int32 to halve the table
+        order = np.argsort(self.affinity_matrix, axis=0, kind='stable')
+        ranks = np.empty(order.shape, dtype=np.int32)
+        np.put_along_axis(ranks, order, np.arange(self.n, dtype=np.int32)[:, None], axis=0)
+        return ranks
+
+    def rank(self, students, groups):
+        """Rank of each student's affinity within its group's column; higher means higher affinity."""
+        return self.affinity_rank[students, groups]
+
+    @cached_property
+    def optimum(self):
+        # Optimal balanced assignment, solved exactly the first time it is asked for
+        from exact import solve_balanced_assignment
+        return solve_balanced_assignment(self)
+
+    @cached_property
+    def fingerprint(self):
+        # Hash of the positive affinities and the group layout, equal for the dense and
+        # sparse forms of one instance; zero affinities only mark forbidden groups
+        digest = hashlib.sha256(np.array([self.n, self.m, self.group_size], dtype=np.int64).tobytes())
+        for array, dtype in zip(self.options, (np.int64, np.int64, np.float64)):
+            digest.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        return digest.hexdigest()
+
+class SparseProblem(Problem):
+    """
+    An instance stored as CSR arrays of its positive affinities: student s has
+    affinity data[k] for group indices[k], for k in indptr[s]:indptr[s + 1].
+
+    Memory and operator work scale with the number of nonzeros instead of n x m.
+    """
+
+    derived_tables = ("_keys", "best_group", "_nonzero_rank")
+
+    def __init__(self, indptr, indices, data, m, group_size=None, path=None, **tables):
+        self.path = path
+        self._setup(len(indptr) - 1, m, group_size)
+        self.indptr, self.indices, self.data = np.asarray(indptr), np.asarray(indices), np.asarray(data)
+        if "_keys" not in tables:
+            # Keep rows sorted by group so (student, group) keys are globally sorted;
+            # arrays that already are (and have the gene dtype) are kept without a copy
+            row_of = np.repeat(np.arange(self.n), np.diff(self.indptr))
+            keys = row_of * m + self.indices
+            if self.indices.dtype != self.gene_dtype or np.any(keys[1:] <= keys[:-1]):
+                order = np.lexsort((self.indices, row_of))
+                self.indices = self.indices[order].astype(self.gene_dtype)
+                self.data = self.data[order]
+                keys = row_of * m + self.indices
+            tables["_keys"] = keys
+        self._adopt(tables)
+
+    @classmethod
+    def from_dense(cls, affinity_matrix, group_size=None):
+        students, groups = np.nonzero(affinity_matrix > 0)
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(students, minlength=affinity_matrix.shape[0]))))
+        return cls(indptr, groups, affinity_matrix[students, groups], affinity_matrix.shape[1], group_size)
+
+    def __reduce__(self):
+        if self.path is not None:
+            return load_problem, (self.path, self.m, self.data.dtype, self.group_size, False)
+        return SparseProblem, (self.indptr, self.indices, self.data, self.m, self.group_size)
+
+    def tables(self):
+        return {name: getattr(self, name) for name in self.derived_tables}
+
+    def arrays(self):
+        return dict({"indptr": self.indptr, "indices": self.indices, "data": self.data}, **self.tables()), {"m": self.m, "group_size": self.group_size}
+
+    def _lookup(self, students, groups):
+        # Position of every (student, group) pair among the nonzeros, and whether it is one
+        keys = np.asarray(students, dtype=np.int64) * self.m + groups
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return positions, self._keys[positions] == keys
+
+    def affinity(self, students, groups):
+        positions, found = self._lookup(students, groups)
+        return np.where(found, self.data[positions], 0.0)
+
+    @property
+    def options(self):
+        return self.indptr, self.indices, self.data
+
+    @cached_property
+    def best_group(self):
+        owners = np.repeat(np.arange(self.n), np.diff(self.indptr))
+        order = np.lexsort((-self.data, owners))
+        first = np.searchsorted(owners[order], np.arange(self.n))
+        best_group = np.zeros(self.n, dtype=self.gene_dtype)
+        has_options = np.diff(self.indptr) > 0
+        best_group[has_options] = self.indices[order[first[has_options]]]
+        return best_group
+
+    @cached_property
+    def _nonzero_rank(self):
+        # Rank of every nonzero within its group's column
+        order = np.lexsort((self.data, self.indices))
+        ranks = np.empty(len(order), dtype=np.int32)
+        ranks[order] = np.arange(len(order)) - np.searchsorted(self.indices[order], self.indices[order])
+        return ranks
+
+    def rank(self, students, groups):
+        # Zero affinities rank below every positive one
+        positions, found = self._lookup(students, groups)
+        return np.where(found, self._nonzero_rank[positions], -1)
+
+def random_problem(n=20, m=4, seed=None):
+    """A random instance with affinities in [0, 5), where those below 1 are floored to 0.1."""
+    affinity_matrix = np.random.default_rng(seed).uniform(0, 5, (n, m))
+    # Ensure no 0-affinity groups for random initialization
+    affinity_matrix[affinity_matrix < 1] = 0.1
+    return Problem(affinity_matrix)
+
+def load_problem(path, m=None, dtype=np.float64, group_size=None, validate=True, **tables):
+    """
+    Open an affinity matrix file.
+
+    `.npy` files are memory-mapped and carry their own shape and dtype. `.npz` files
+    hold a sparse instance as CSR `indptr`, `indices`, `data` and `shape` arrays (the
+    layout scipy.sparse.save_npz writes). Any other file is memory-mapped as raw
+    `dtype` values, row by row, with `m` columns. n, m and (unless given)
+    group_size = n // m follow from the file. `tables` are precomputed derived tables
+    (see Problem.arrays).
+
+    Processes that load the same file share its mapping, but each builds the derived
+    tables it uses (`options` alone is about 1.25 times a dense matrix) and reads `.npz`
+    instances into its own memory; share_problem shares those as well.
+    """
+    path = str(path)
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            problem = SparseProblem(arrays["indptr"], arrays["indices"], arrays["data"], int(arrays["shape"][1]), group_size, path=path, **tables)
+    else:
+        if path.endswith(".npy"):
+            affinity_matrix = np.load(path, mmap_mode="r")
+        else:
+            if m is None:
+                raise ValueError("Raw affinity files need the number of groups `m`")
+            values = np.memmap(path, dtype=dtype, mode="r")
+            if values.size % m:
+                raise ValueError(f"{path} holds {values.size} values, not a multiple of m={m}")
+            affinity_matrix = values.reshape(-1, m)
+        problem = Problem(affinity_matrix, group_size, path=path, **tables)
+    if validate:
+        validate_problem(problem)
+    return problem
+
+def validate_problem(problem):
+    """Check that an instance can be balanced and follows the zero-affinity floor rule."""
+    if problem.n != problem.m * problem.group_size:
+        raise ValueError(f"{problem.n} students cannot fill {problem.m} groups of {problem.group_size}")
+    values = problem.data if isinstance(problem, SparseProblem) else problem.affinity_matrix
+    if not np.all(np.isfinite(values)) or np.any(values < 0):
+        raise ValueError("Affinities must be finite and non-negative")
+    # Zero affinity means the group is not allowed; every student needs at least one option
+    indptr, option_groups, _ = problem.options
+    stranded = np.where(np.diff(indptr) == 0)[0]
+    if stranded.size:
+        raise ValueError(f"Students without any positive-affinity group: {stranded[:10]}")
+    short = np.where(np.bincount(option_groups, minlength=problem.m) < problem.group_size)[0]
+    if short.size:
+        raise ValueError(f"Groups with fewer than {problem.group_size} eligible students: {short[:10]}")
+
+_problem = None
+
+def get_problem():
+    """
+    The instance the operators work on. Unless one was set, it is built from the
+    instance settings in parameters.py the first time it is asked for.
+    """
+    global _problem
+    if _problem is None:
+        import parameters
+        if parameters.instance_path is None:
+            _problem = random_problem(parameters.students, parameters.groups, parameters.instance_seed)
+        else:
+            _problem = load_problem(parameters.instance_path, m=parameters.groups)
+    return _problem
+
+def set_problem(problem):
+    global _problem
+    _problem = problem
+
+@contextmanager
+def use_problem(problem):
+    """Make `problem` the instance the operators work on for the duration of the block."""
+    global _problem
+    previous = _problem
+    _problem = problem
+    try:
+        yield problem
+    finally:
+        _problem = previous
+
+def share_problem(problem):
+    """
+    Copy an instance's arrays and derived tables into one shared memory block, from
+    which attach_problem rebuilds it in other processes without copying them.
+
+    Memory-mapped matrices stay out of the block, since every process can map them
+    from their file; only their tables are shared. Returns the block, to close and
+    unlink once the other processes are done, and the handle to pass them.
+    """
+    arrays, settings = problem.arrays()
+    if isinstance(getattr(problem, "affinity_matrix", None), np.memmap):
+        build, args = problem.__reduce__()
+        arrays, settings = problem.tables(), {}
+    else:
+        build, args, settings = type(problem), (), dict(settings, path=problem.path)
+    layouts, offset = {}, 0
+    for name, array in arrays.items():
+        layouts[name] = (offset, array.shape, array.dtype)
+        offset += -(-array.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        start, shape, dtype = layouts[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = array
+    return shm, (shm.name, layouts, build, args, settings)
+
+# Blocks this process attached to, kept open for as long as it runs
+_attached = []
+
+def attach_problem(handle):
+    """Make the instance shared by share_problem the current one, reading its block in place."""
+    name, layouts, build, args, settings = handle
+    shm = shared_memory.SharedMemory(name=name)
+    _attached.append(shm)
+    arrays = {}
+    for array_name, (offset, shape, dtype) in layouts.items():
+        arrays[array_name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        arrays[array_name].flags.writeable = False
+    set_problem(build(*args, **settings, **arrays))
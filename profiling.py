@@ -0,0 +1,126 @@
+import csv
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+PHASES = ("initialization", "selection", "crossover", "mutation", "repair", "evaluation", "local_search", "deduplication")
+STATISTICS = ("generation", "best_fitness", "mean_fitness", "fitness_std", "distinct_fitness", "distinct_chromosomes")
+
+class RunProfile:
+    """
+    Per-generation wall time of every GA phase and counts of operator calls.
+
+    Pass one to genetic_algorithm(profile=...) to fill it. Each generation adds a record
+    with the time spent on every phase while breeding it (repair time is also part of
+    the crossover and mutation phases that call it), the operator counters, and the
+    best, mean, standard deviation and number of distinct fitness values (and, if the
+    genes are given, distinct chromosomes) of the population. `callback`, if given,
+    receives every record as it is made.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.generations = []
+        self.stopped_at = None  # Generation where early stopping triggered
+        self._times = defaultdict(float)
+        self._counts = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._times[name] += time.perf_counter() - start
+
+    def count(self, name, k=1):
+        self._counts[name] += k
+
+    def end_generation(self, generation, fitness_scores, population=None):
+        record = {
+            "generation": generation,
+            "best_fitness": float(np.max(fitness_scores)),
+            "mean_fitness": float(np.mean(fitness_scores)),
+            "fitness_std": float(np.std(fitness_scores)),
+            "distinct_fitness": int(len(np.unique(fitness_scores))),
+        }
+        if population is not None:
+            record["distinct_chromosomes"] = int(len(np.unique(population, axis=0)))
+        record.update((f"time_{name}", self._times[name]) for name in PHASES)
+        record.update(self._counts)
+        self._times.clear()
+        self._counts.clear()
+        self.generations.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def totals(self):
+        """Phase times and counters summed over the run."""
+        totals = defaultdict(float)
+        for record in self.generations:
+            for key, value in record.items():
+                if key not in STATISTICS:
+                    totals[key] += value
+        totals["generations"] = len(self.generations)
+        totals["stopped_at"] = self.stopped_at
+        return dict(totals)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"generations": self.generations, "stopped_at": self.stopped_at}, f, indent=2)
+
+    def to_csv(self, path):
+        # Counters only appear once used, so the columns are the union over all records
+        columns = list(dict.fromkeys(key for record in self.generations for key in record))
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.generations)
+
+class _State(threading.local):
+    profile = None
+
+# The profile of the run on this thread; operators report to it through phase() and count()
+_state = _State()
+
+def active_profile():
+    return _state.profile
+
+@contextmanager
+def activate(profile):
+    """Make `profile` the one operators report to, for the duration of the block."""
+    previous = active_profile()
+    _state.profile = profile
+    try:
+        yield profile
+    finally:
+        _state.profile = previous
+
+_disabled = nullcontext()
+
+def phase(name):
+    profile = _state.profile
+    return _disabled if profile is None else profile.phase(name)
+
+def count(name, k=1):
+    profile = _state.profile
+    if profile is not None:
+        profile.count(name, k)
+
+def print_phase_table(results):
+    """Print the mean time per phase and the counters of every method that was profiled."""
+    profiles = {method_name: result["profile"] for method_name, result in results.items() if result.get("profile")}
+    if not profiles:
+        return
+    counters = sorted({key for totals in profiles.values() for key in totals
+                       if not key.startswith("time_") and key not in ("generations", "stopped_at")})
+    columns = [f"time_{name}" for name in PHASES] + counters
+    width = max(len(method_name) for method_name in profiles)
+    print(f"{'Method':<{width}}  {'gens':>6}  " + "  ".join(f"{column.removeprefix('time_'):>14}" for column in columns))
+    for method_name, totals in profiles.items():
+        cells = [f"{totals.get(column, 0):>13.4f}s" if column.startswith("time_") else f"{totals.get(column, 0):>14.1f}"
+                 for column in columns]
+        print(f"{method_name:<{width}}  {totals['generations']:>6.1f}  " + "  ".join(cells))
@@ -0,0 +1,52 @@
+import math
+import numpy as np
+from runner import run_experiments
+
+def _rank_configs(results):
+    # Rank on mean best fitness and on final mean fitness; the sum of both ranks orders
+    # the methods, with ties going to the higher best fitness
+    names = list(results)
+    best = np.array([np.mean(results[name]["best_fitness"]) for name in names])
+    final = np.array([results[name]["avg_fitness_progress"][-1] for name in names])
+    score = np.argsort(np.argsort(-best)) + np.argsort(np.argsort(-final))
+    return [names[i] for i in np.lexsort((-best, score))]
+
+def race(configs, trials, generations, min_generations=10, eta=2, finalists=1, processes=None, profile=False, store=None):
+    """
+    Compare GA configurations by successive halving instead of giving each the full budget.
+
+    Every rung runs the surviving configurations and keeps the best 1/`eta` of them,
+    ranked on both their mean best fitness and their final average fitness, until
+    `finalists` remain. Budgets grow by `eta` per rung: the first rung runs
+    `min_generations` generations and a matching share of the `trials`, and the final
+    rung runs the finalists for the full `generations` and `trials`.
+
+    Args:
+        configs: Dict mapping method names to genetic_algorithm keyword arguments.
+        trials: Number of runs per method in the final rung.
+        generations: Generations per run in the final rung.
+        store: Passed on to run_experiments, so rungs already run are read back instead.
+
+    Returns:
+        The run_experiments results of the final rung (finalists only), and the
+        elimination history as a list of (rung, generations, trials, eliminated names).
+    """
+    survivors = dict(configs)
+    rungs = max(1, math.ceil(math.log(len(survivors) / finalists, eta)) + 1) if len(survivors) > finalists else 1
+    history = []
+    for rung in range(rungs):
+        shrink = eta ** (rungs - 1 - rung)
+        rung_generations = min(generations, max(min_generations, generations // shrink))
+        rung_trials = max(1, math.ceil(trials / shrink))
+        rung_configs = {name: dict(ga_kwargs, generations=rung_generations) for name, ga_kwargs in survivors.items()}
+        results = run_experiments(rung_configs, rung_trials, processes, profile=profile, store=store)
+        if rung == rungs - 1:
+            history.append((rung, rung_generations, rung_trials, []))
+            return results, history
+
+        ranking = _rank_configs(results)
+        keep = max(finalists, math.ceil(len(ranking) / eta))
+        eliminated = ranking[keep:]
+        print(f"Rung {rung + 1}: {rung_generations} generations x {rung_trials} trials, eliminated {', '.join(eliminated) or 'none'}")
+        history.append((rung, rung_generations, rung_trials, eliminated))
+        survivors = {name: survivors[name] for name in ranking[:keep]}
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Modules whose code decides what a run computes; editing any of them starts a new code version
+CODE_MODULES = [
+    "chromosome.py", "crossover_methods.py", "exact.py", "fitness_cache.py", "genetic_algorithm.py",
+    "genetic_operations.py", "helpers.py", "local_search.py", "problem.py", "runner.py",
+]
+
+_code_version = None
+
+def code_version():
+    """Hash of the sources in CODE_MODULES."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_MODULES:
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+def describe(value):
+    """A stable text form of an argument: operators by their qualified name, everything else by its repr."""
+    if callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+def run_key(ga_kwargs, trial, problem):
+    """
+    Key of one run: its genetic_algorithm arguments, the trial seeding its generator,
+    the instance fingerprint and the code version. Method names are only labels and
+    are left out, so renaming a method does not invalidate its runs.
+    """
+    description = {
+        "params": {name: describe(value) for name, value in sorted(ga_kwargs.items())},
+        "trial": trial,
+        "problem": problem.fingerprint,
+        "code": code_version(),
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32], description
+
+class ResultStore:
+    """
+    On-disk store of finished runs, one .npz file per run named by its run_key.
+
+    Each file holds the run's best fitness, its average fitness per generation, its wall
+    time, the profile totals when it was profiled, and the description its key was
+    hashed from, so stored runs can be inspected without the code that made them.
+    """
+
+    def __init__(self, directory="results"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        """The stored run as (best_fitness, avg_fitness_per_gen, seconds, totals), or None."""
+        if key not in self:
+            return None
+        with np.load(self.path(key)) as run:
+            totals = None
+            if run["totals_keys"].size:
+                totals = {str(name): float(value) for name, value in zip(run["totals_keys"], run["totals_values"])}
+                totals["stopped_at"] = None if np.isnan(totals["stopped_at"]) else int(totals["stopped_at"])
+            return float(run["best_fitness"]), list(run["avg_fitness_progress"]), float(run["seconds"]), totals
+
+    def put(self, key, description, best_fitness, avg_fitness_per_gen, seconds, totals=None):
+        totals = totals or {}
+        values = [np.nan if value is None else value for value in totals.values()]
+        # Written to a temporary file first, so an interrupted grid never leaves a truncated run
+        temporary = f"{self.path(key)}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez_compressed(
+                f,
+                best_fitness=best_fitness,
+                avg_fitness_progress=np.array(avg_fitness_per_gen, dtype=float),
+                seconds=seconds,
+                totals_keys=np.array(list(totals), dtype=str),
+                totals_values=np.array(values, dtype=float),
+                description=np.array(json.dumps(description, sort_keys=True)),
+            )
+        os.replace(temporary, self.path(key))
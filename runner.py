@@ -0,0 +1,166 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+from helpers import align_fitness_progressions, measure_convergence_speed
+from genetic_algorithm import genetic_algorithm
+from genetic_operations import fitness
+from problem import get_problem, share_problem, attach_problem
+from profiling import RunProfile, print_phase_table
+from result_store import ResultStore, run_key
+from exact import optimality_gaps
+from plotting import plot_results, plot_convergence_speed
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def run_trial(method_name, trial, ga_kwargs, profile=False):
+    """One GA run, with its own generator seeded from the trial number, so it does not depend on the worker it runs in."""
+    rng = np.random.default_rng(np.random.SeedSequence(trial))
+    run_profile = RunProfile() if profile else None
+    start = time.perf_counter()
+    best_solution, avg_fitness_per_gen = genetic_algorithm(**ga_kwargs, rng=rng, profile=run_profile)
+    seconds = time.perf_counter() - start
+    totals = run_profile.totals() if profile else None
+    return method_name, trial, fitness(best_solution), avg_fitness_per_gen, seconds, totals
+
+def _run_job(job):
+    return run_trial(*job)
+
+def _collect(runs, configs, store=None):
+    collected = []
+    for run in runs:
+        method_name, trial, best_fitness, avg_fitness_per_gen, seconds, totals = run
+        if store is not None:
+            # Stored as soon as it finishes, so an interrupted grid resumes where it stopped
+            store.put(*run_key(configs[method_name], trial, get_problem()), best_fitness, avg_fitness_per_gen, seconds, totals)
+        print(f"Run {trial + 1}: {method_name} - Best fitness: {best_fitness}")
+        print(f"Run {trial + 1}: {method_name} - Avg fitness per generation: {avg_fitness_per_gen[:5]+avg_fitness_per_gen[-5:]}")
+        collected.append(run)
+    return collected
+
+def _mean_totals(run_totals):
+    # Mean of every phase time and counter over the runs; stopped_at over the runs that stopped early
+    keys = {key for totals in run_totals for key in totals if key != "stopped_at"}
+    mean = {key: np.mean([totals.get(key, 0) for totals in run_totals]) for key in keys}
+    stopped = [totals["stopped_at"] for totals in run_totals if totals["stopped_at"] is not None]
+    mean["stopped_at"] = np.mean(stopped) if stopped else None
+    return mean
+
+def _aggregate(configs, runs):
+    results = {method_name: {"best_fitness": [], "avg_fitness_progress": [], "seconds": []} for method_name in configs}
+    fitness_runs = {method_name: [] for method_name in configs}
+    profile_runs = {method_name: [] for method_name in configs}
+    for method_name, trial, best_fitness, avg_fitness_per_gen, seconds, totals in runs:
+        results[method_name]["best_fitness"].append(best_fitness)
+        results[method_name]["seconds"].append(seconds)
+        fitness_runs[method_name].append(avg_fitness_per_gen)
+        if totals is not None:
+            profile_runs[method_name].append(totals)
+    for method_name, avg_fitness_runs in fitness_runs.items():
+        results[method_name]["avg_fitness_progress"] = np.mean(align_fitness_progressions(avg_fitness_runs), axis=0)
+        if profile_runs[method_name]:
+            results[method_name]["profile"] = _mean_totals(profile_runs[method_name])
+    return results
+
+def _stored_run(store, method_name, trial, ga_kwargs, profile):
+    # The stored run of this (method, trial) pair, unless it is missing or lacks a requested profile
+    run = store.get(run_key(ga_kwargs, trial, get_problem())[0])
+    if run is None or (profile and run[3] is None):
+        return None
+    return (method_name, trial, *run)
+
+def load_results(configs, trials, store, profile=False):
+    """The run_experiments results of `configs`, read from `store` without running anything."""
+    runs = []
+    for method_name, ga_kwargs in configs.items():
+        for trial in range(trials):
+            run = _stored_run(store, method_name, trial, ga_kwargs, profile)
+            if run is None:
+                raise KeyError(f"Run {trial + 1} of {method_name} is not in {store.directory}")
+            runs.append(run)
+    return _aggregate(configs, runs)
+
+def run_experiments(configs, trials, processes=None, profile=False, store=None):
+    """
+    Run every (method, trial) pair on a process pool and aggregate the results.
+
+    Each run draws from its own generator seeded with its trial number, so the results
+    are identical to running the grid serially in one process.
+
+    Args:
+        configs: Dict mapping method names to genetic_algorithm keyword arguments.
+        trials: Number of runs per method.
+        processes: Pool size; defaults to the number of available cores, 1 runs serially.
+        profile: Also record per-phase timings and operator counters of every run.
+        store: A result_store.ResultStore; only the runs it does not hold yet are run,
+            each is stored as soon as it finishes, and the results are read back from it.
+
+    Returns:
+        Dict mapping method names to their "best_fitness" and "seconds" lists and mean
+        "avg_fitness_progress", plus, when profiling, the "profile" totals averaged over the trials.
+    """
+    jobs = [(method_name, trial, ga_kwargs, profile) for method_name, ga_kwargs in configs.items() for trial in range(trials)
+            if store is None or _stored_run(store, method_name, trial, ga_kwargs, profile) is None]
+    if store is not None:
+        print(f"{len(configs) * trials - len(jobs)} run(s) found in {store.directory}, {len(jobs)} to run")
+    processes = max(1, min(processes or available_cores(), len(jobs)))
+
+    if processes > 1:
+        # Workers run on the parent's instance and its derived tables from shared memory
+        shm, problem_handle = share_problem(get_problem())
+        try:
+            with multiprocessing.Pool(processes, initializer=attach_problem, initargs=(problem_handle,)) as pool:
+                runs = _collect(pool.imap(_run_job, jobs), configs, store)
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        runs = _collect(map(_run_job, jobs), configs, store)
+
+    # Aggregate only once every run has finished
+    if store is not None:
+        return load_results(configs, trials, store, profile)
+    return _aggregate(configs, runs)
+
+def run_and_report(configs, xasis):
+    """
+    Run an experiment grid with the settings in parameters.py and report on it.
+
+    `configs` maps method names to genetic_algorithm keyword arguments. The methods are
+    raced or run in full, skipping the runs the results store already holds; then
+    their phase times, optimality gaps and convergence speeds are printed and their
+    results plotted in the background, labelled with `xasis`. Returns the results.
+    """
+    import parameters
+    from racing import race  # racing imports this module
+
+    # Runs of earlier invocations are read back from the store instead of being repeated
+    store = ResultStore(parameters.results_dir) if parameters.results_dir else None
+
+    if parameters.racing:
+        # Successive halving: losing methods are dropped after short, cheap runs
+        results, _ = race(configs, parameters.trials, parameters.generations, profile=True, store=store)
+    else:
+        # Run every (method, trial) pair on all available cores
+        results = run_experiments(configs, parameters.trials, profile=True, store=store)
+
+    # Where each method spends its time, averaged over the trials
+    print_phase_table(results)
+
+    # How far each method stays from the exact optimum
+    optimum = fitness(get_problem().optimum)
+    print(f"Optimal fitness: {optimum}")
+    for method_name, gap in optimality_gaps(results, optimum).items():
+        print(f"Optimality gap for {method_name}: {gap:.2%}")
+
+    convergence_speed = measure_convergence_speed(results)
+    for method_name, speed in convergence_speed.items():
+        print(f"Convergence speed for {method_name}: {speed} generations")
+
+    # Plot results in the background; only the aggregated arrays go to the plotting process
+    plot_results(results, xasis, parameters.plot_dir, background=True)
+    plot_convergence_speed(convergence_speed, xasis, parameters.plot_dir, background=True)
+    return results
@@ -1,11 +1,7 @@
-import numpy as np
-from helpers import align_fitness_progressions
-from parameters import pop_size, generations, mutation_rate, elitism, patience, trials, crossover_methods
-from genetic_algorithm import genetic_algorithm
+from parameters import pop_size, generations, mutation_rate, elitism, patience, crossover_methods
+from runner import run_and_report
 from crossover_methods import *
-from plotting import plot_results, plot_convergence_speed
 from genetic_operations import *
-import random
 
 selection_methods = {
     "Tournament": tournament_selection,
@@ -13,19 +9,9 @@ selection_methods = {
     "Stochastic Sampling": stochastic_universal_sampling,
 }
 
-# Storage for results
-results = {method: {"best_fitness": [], "avg_fitness_progress": []} for method in selection_methods.keys()}
-
-# Run experiments
-for method_name, method in selection_methods.items():
-    print(f"Testing {method_name} selection...")
-    best_fitness_runs = []
-    avg_fitness_runs = []
-
-    for trial in range(trials):
-        random.seed(trial)
-        np.random.seed(trial)
-        best_solution, avg_fitness_per_gen = genetic_algorithm(
+def main():
+    configs = {
+        method_name: dict(
             pop_size=pop_size,
             generations=generations,
             mutation_rate=mutation_rate,
@@ -34,34 +20,11 @@ for method_name, method in selection_methods.items():
             crossover_method=uniform_crossover,
             select=method
         )
+        for method_name, method in selection_methods.items()
+    }
 
-        final_fitness = fitness(best_solution)
-        best_fitness_runs.append(final_fitness)
-        avg_fitness_runs.append(avg_fitness_per_gen)
-
-        # Debugging: Print the fitness values for each generation
-        print(f"Run {trial + 1}: {method_name} - Best fitness: {fitness(best_solution)}")
-        print(f"Run {trial + 1}: {method_name} - Avg fitness per generation: {avg_fitness_per_gen[:5]+avg_fitness_per_gen[-5:]}")
-
-    # Align and store results
-    aligned_avg_fitness_runs = align_fitness_progressions(avg_fitness_runs)
-    results[method_name]["best_fitness"] = best_fitness_runs
-    results[method_name]["avg_fitness_progress"] = np.mean(aligned_avg_fitness_runs, axis=0)
-
-convergence_speed = {}
-for method_name, method_results in results.items():
-    threshold = 0.9 * min(method_results["best_fitness"])
-    generations_to_converge = []
-
-    for generation_index, fitness_value in enumerate(method_results["avg_fitness_progress"]):
-        if fitness_value >= threshold:
-            generations_to_converge.append(generation_index)
-            break  # Once the threshold is reached, stop checking further generations
-    if generations_to_converge == []:
-        generations_to_converge.append(0)
-    convergence_speed[method_name] = np.mean(generations_to_converge)
-    print(f"Convergence speed for {method_name}: {convergence_speed[method_name]} generations")
+    run_and_report(configs, "Selection methods")
 
-# Plot results
-plot_results(results, "Selection methods")
-plot_convergence_speed(convergence_speed)
\ No newline at end of file
+# Pool workers and the plotting process re-import this module under the spawn start method
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from problem import Problem, SparseProblem, random_problem, use_problem
+
+def _with_zeros(n, m, zeros, seed):
+    rng = np.random.default_rng(seed)
+    affinity_matrix = rng.uniform(1, 5, (n, m))
+    affinity_matrix[rng.random((n, m)) < zeros] = 0
+    # Student s may always join group s % m, so the instance can be balanced
+    affinity_matrix[np.arange(n), np.arange(n) % m] = rng.uniform(1, 5, n)
+    return Problem(affinity_matrix)
+
+INSTANCES = {
+    "positive": lambda: random_problem(30, 5, seed=0),
+    "zeros": lambda: _with_zeros(30, 5, 0.5, seed=1),
+    "sparse": lambda: SparseProblem.from_dense(_with_zeros(60, 6, 0.7, seed=2).affinity_matrix),
+}
+
+@pytest.fixture(params=list(INSTANCES))
+def problem(request):
+    """Every test instance in turn, as the instance the operators work on."""
+    with use_problem(INSTANCES[request.param]()) as problem:
+        yield problem
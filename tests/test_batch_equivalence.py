@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from helpers import initialize_population, random_valid_groups, population_counts, plan_repair, repair_balance, repair_balance_batch
+from genetic_operations import population_fitness, move_to_other_option
+from local_search import swap_local_search
+from crossover_methods import batch_crossover_methods
+
+TRIALS = 1000
+
+def _check_valid_and_balanced(problem, children):
+    assert np.all(population_counts(children) == problem.group_size)
+    assert np.all(problem.affinity(problem.students, children) > 0)
+
+@pytest.mark.parametrize("crossover", list(batch_crossover_methods), ids=lambda crossover: crossover.__name__)
+def test_batch_crossover_inherits_like_per_pair(problem, crossover):
+    # How often each child keeps the first parent's gene, per student, over many crossovers of one pair
+    parent1, parent2 = initialize_population(2, rng=0)
+    rng = np.random.default_rng(1)
+    per_pair = np.array([[child.genes for child in crossover(parent1, parent2, rng=rng)] for _ in range(TRIALS)])
+    batch = np.stack(batch_crossover_methods[crossover](np.tile(parent1, (TRIALS, 1)), np.tile(parent2, (TRIALS, 1)), rng=2), axis=1)
+
+    differ = parent1 != parent2
+    per_pair_frequency = np.mean(per_pair == parent1, axis=0)[:, differ]
+    batch_frequency = np.mean(batch == parent1, axis=0)[:, differ]
+    assert np.max(np.abs(per_pair_frequency - batch_frequency)) < 0.1
+    _check_valid_and_balanced(problem, batch.reshape(-1, problem.n))
+
+@pytest.mark.parametrize("crossover", list(batch_crossover_methods), ids=lambda crossover: crossover.__name__)
+def test_batch_crossover_buffers_match_new_arrays(problem, crossover):
+    parents = initialize_population(20, rng=3)
+    parents1, parents2 = parents[:10], parents[10:]
+    batch_crossover = batch_crossover_methods[crossover]
+    children1, children2 = batch_crossover(parents1, parents2, rng=4)
+    out = np.empty_like(parents)
+    # Scratch buffers with spare rows, as PopulationArena passes them
+    batch_crossover(parents1, parents2, rng=4, out=out, draws=np.empty((12, problem.n)), mask=np.empty((12, problem.n), dtype=bool))
+    assert np.array_equal(out[0::2], children1)
+    assert np.array_equal(out[1::2], children2)
+    _check_valid_and_balanced(problem, out)
+
+def test_repair_balance_batch_matches_per_chromosome(problem):
+    population = random_valid_groups((50, problem.n), rng=5)
+    expected = np.array([repair_balance(genes.copy()) for genes in population])
+    counts, scores = population_counts(population), population_fitness(population)
+    repair_balance_batch(population, counts, scores)
+    assert np.array_equal(population, expected)
+    assert np.array_equal(counts, population_counts(population))
+    assert np.allclose(scores, population_fitness(population))
+
+def test_plan_repair_balances_every_chromosome(problem):
+    population = random_valid_groups((200, problem.n), rng=6)
+    counts = population_counts(population)
+    rows, students, groups = plan_repair(population, counts)
+
+    # Every student moves at most once, into a group it may join
+    assert len(np.unique(rows * problem.n + students)) == len(rows)
+    assert np.all(problem.affinity(students, groups) > 0)
+    population[rows, students] = groups
+    _check_valid_and_balanced(problem, population)
+
+def test_repair_keeps_mutated_students_in_their_new_groups(problem):
+    # Repair would otherwise often evict the mutated student straight back to its old group
+    population = initialize_population(50, rng=7)
+    swap_local_search(population)
+    rng = np.random.default_rng(8)
+    counts = population_counts(population)
+    rows, students = move_to_other_option(population, np.arange(50), rng.integers(problem.n, size=50), rng.random(50), counts)
+    groups = population[rows, students]
+    repair_balance_batch(population, counts, pinned=(rows, students))
+    assert rows.size and np.array_equal(population[rows, students], groups)
+    _check_valid_and_balanced(problem, population)
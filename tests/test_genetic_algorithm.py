@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from helpers import initialize_population, population_counts
+from genetic_operations import population_fitness
+from problem import random_problem, use_problem
+from crossover_methods import uniform_crossover
+from genetic_algorithm import Evolution, _replace_duplicates
+from fitness_cache import distinct_rows
+
+@pytest.mark.parametrize("mode", ["fresh", "mutate"])
+def test_replace_duplicates_leaves_no_clones(problem, mode):
+    # Copies of a few elites, as heuristic crossovers with high elitism produce
+    population = np.tile(initialize_population(4, rng=9), (10, 1))
+    counts, scores = population_counts(population), population_fitness(population)
+    _replace_duplicates(population, 4, counts, scores, mode, np.random.default_rng(10))
+    assert len(distinct_rows(population)) == len(population)
+    assert np.array_equal(counts, population_counts(population))
+    assert np.allclose(scores, population_fitness(population))
+    assert np.all(counts == problem.group_size)
+
+def _run_until(evolution, generation):
+    for state in evolution:
+        if state["generation"] == generation:
+            return state
+
+def test_checkpoint_resumes_the_interrupted_run(problem, tmp_path):
+    path = tmp_path / "run.npz"
+    settings = dict(pop_size=20, generations=12, patience=100, crossover_method=uniform_crossover, rng=0)
+    uninterrupted = _run_until(Evolution(**settings), 11)
+    _run_until(Evolution(**settings, checkpoint_path=path, checkpoint_every=5), 6)
+    resumed = _run_until(Evolution(**settings, checkpoint_path=path), 11)
+    assert np.array_equal(resumed["fitness_scores"], uninterrupted["fitness_scores"])
+
+@pytest.mark.parametrize("change", ["instance", "settings"])
+def test_checkpoint_of_another_run_is_rejected(problem, tmp_path, change):
+    path = tmp_path / "run.npz"
+    Evolution(pop_size=20, crossover_method=uniform_crossover, rng=0).save_checkpoint(path)
+    other = random_problem(problem.n, problem.m, seed=99) if change == "instance" else problem
+    mutation_rate = 0.5 if change == "settings" else 0.1
+    with use_problem(other), pytest.raises(ValueError, match="different"):
+        Evolution(pop_size=20, mutation_rate=mutation_rate, crossover_method=uniform_crossover, rng=0, checkpoint_path=path)
@@ -0,0 +1,35 @@
+import numpy as np
+from problem import Problem, random_problem, load_problem, share_problem, attach_problem, get_problem, use_problem
+
+def _attached(problem):
+    # The instance attach_problem rebuilds from a block, as a pool worker would
+    shm, handle = share_problem(problem)
+    try:
+        with use_problem(None):
+            attach_problem(handle)
+            return get_problem(), handle
+    finally:
+        shm.close()
+        shm.unlink()
+
+def test_shared_problem_reads_its_tables_from_the_block():
+    problem = random_problem(40, 4, seed=1)
+    attached, _ = _attached(problem)
+    for name, table in problem.tables().items():
+        shared = attached.tables()[name]
+        assert np.array_equal(shared, table) and not shared.flags.writeable
+    assert attached.fingerprint == problem.fingerprint
+
+def test_memory_mapped_problem_shares_only_its_tables(tmp_path):
+    path = tmp_path / "affinity.npy"
+    np.save(path, random_problem(40, 4, seed=2).affinity_matrix)
+    problem = load_problem(path)
+    attached, handle = _attached(problem)
+    assert "affinity_matrix" not in handle[1]
+    assert isinstance(attached.affinity_matrix, np.memmap)
+    assert np.array_equal(attached.affinity_rank, problem.affinity_rank)
+
+def test_affinity_rank_orders_every_column():
+    problem = Problem(np.array([[3.0, 1.0], [1.0, 2.0], [2.0, 2.0]]))
+    assert problem.affinity_rank.dtype == np.int32
+    assert problem.affinity_rank.tolist() == [[2, 0], [0, 1], [1, 2]]